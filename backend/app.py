@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # Imports diretos para evitar problemas de módulos
@@ -12,6 +13,7 @@ from routers.api import router as api_router
 from routers.blog import router as blog_router
 from routers.admin import router as admin_router
 from routers.payments import router as payments_router
+from services.tramagrid.offload import Overloaded
 
 # Criar aplicação FastAPI
 app = FastAPI()
@@ -24,6 +26,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Paginação de /api/posts
 )
 
 # Incluir routers
@@ -48,6 +51,11 @@ def health_check():
     """Verificação de saúde da API"""
     return {"status": "ok", "service": "TramaGrid Backend"}
 
+# Pool de trabalho pesado cheio: 503 para o cliente tentar de novo (em vez de enfileirar sem limite)
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "2"})
+
 # Tratamento global de erros CORS
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
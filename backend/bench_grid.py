@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark de redesenho da grade (draw_grid) antes/depois da conversão vetorizada da paleta
+
+Uso: python bench_grid.py [repeticoes]
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import random
+import time
+from PIL import Image, ImageDraw
+
+from services.tramagrid.session import TramaGridSession
+from services.tramagrid import grid
+
+SIZES = [(130, 200), (400, 600)]
+COLORS = 64
+
+def make_session(w: int, h: int) -> TramaGridSession:
+    """Cria uma sessão sintética com índices aleatórios"""
+    rnd = random.Random(42)
+    session = TramaGridSession()
+    session.quantized = Image.frombytes("P", (w, h), bytes(rnd.randrange(COLORS) for _ in range(w * h)))
+    session.palette = {i: (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for i in range(COLORS)}
+    return session
+
+def legacy_quantized_to_rgb(session: TramaGridSession, box=None) -> Image.Image:
+    """Conversão antiga: loop aninhado de getpixel + ImageDraw.point"""
+    wc, hc = session.quantized.size
+    temp_rgb = Image.new("RGB", (wc, hc))
+    temp_draw = ImageDraw.Draw(temp_rgb)
+    for y in range(hc):
+        for x in range(wc):
+            color_idx = session.quantized.getpixel((x, y))
+            color = session.palette.get(color_idx, (255, 255, 255))
+            temp_draw.point((x, y), color)
+    return temp_rgb
+
+def timed(fn, repeat: int) -> float:
+    """Retorna o menor tempo (s) entre as repetições"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run(repeat: int = 3):
+    fast = grid.quantized_to_rgb
+    print(f"{'grade':>10} | {'conv antes':>11} | {'conv depois':>11} | {'redraw antes':>12} | {'redraw depois':>13}")
+    for w, h in SIZES:
+        session = make_session(w, h)
+
+        assert legacy_quantized_to_rgb(session).tobytes() == fast(session).tobytes()
+        conv_old = timed(lambda: legacy_quantized_to_rgb(session), repeat)
+        conv_new = timed(lambda: fast(session), repeat)
+
+        grid.quantized_to_rgb = legacy_quantized_to_rgb
+        try:
+            draw_old = timed(lambda: grid.draw_grid(session), repeat)
+        finally:
+            grid.quantized_to_rgb = fast
+        draw_new = timed(lambda: grid.draw_grid(session), repeat)
+        session.grid_image = None
+
+        print(f"{f'{w}x{h}':>10} | {conv_old * 1000:>9.1f}ms | {conv_new * 1000:>9.1f}ms | "
+              f"{draw_old * 1000:>10.1f}ms | {draw_new * 1000:>11.1f}ms")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
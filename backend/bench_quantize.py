@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos motores de quantização (tempo e erro de cor) por tamanho de grade e max_colors
+
+Uso: python bench_quantize.py [repeticoes]
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import time
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from services.tramagrid.quantize import QUANTIZERS, quantize, palette_colors
+
+SIZES = [(130, 200), (260, 400), (400, 600)]
+COLORS = [16, 32, 64]
+
+def make_image(w: int, h: int) -> Image.Image:
+    """Imagem sintética com gradientes suaves e detalhe fino (parecida com uma foto reduzida)"""
+    r = Image.linear_gradient("L").resize((w, h))
+    g = Image.radial_gradient("L").resize((w, h))
+    b = Image.effect_mandelbrot((w, h), (-2.0, -1.2, 0.8, 1.2), 60)
+    return ImageEnhance.Color(Image.merge("RGB", (r, g, b))).enhance(1.4)
+
+def color_error(src: Image.Image, quantized: Image.Image) -> float:
+    """Erro RMS por canal (0..255) entre a imagem e a versão quantizada"""
+    a = np.asarray(src, dtype=np.float32)
+    b = np.asarray(quantized.convert("RGB"), dtype=np.float32)
+    return float(np.sqrt(((a - b) ** 2).mean()))
+
+def timed(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def run(repeat: int = 3) -> None:
+    print(f"{'grade':>10} {'cores':>5} {'motor':>16} {'tempo (ms)':>11} {'erro RMS':>9}")
+    for w, h in SIZES:
+        img = make_image(w, h)
+        for colors in COLORS:
+            for name in QUANTIZERS:
+                elapsed, out = timed(lambda: quantize(img, colors, name), repeat)
+                print(f"{w}x{h:>6} {colors:>5} {name:>16} {elapsed * 1000:>11.1f} {color_error(img, out):>9.2f}")
+
+            # k-means semeado com a paleta de uma imagem levemente diferente (ex.: brilho +5%)
+            prev = quantize(ImageEnhance.Brightness(img).enhance(1.05), colors, "kmeans")
+            seed = palette_colors(prev, colors)
+            elapsed, out = timed(lambda: quantize(img, colors, "kmeans", seed), repeat)
+            print(f"{w}x{h:>6} {colors:>5} {'kmeans (semente)':>16} {elapsed * 1000:>11.1f} {color_error(img, out):>9.2f}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -19,6 +19,18 @@ STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
+# Cache de leitura do blog (por processo): validade em segundos e quantidade máxima de entradas
+BLOG_CACHE_TTL = int(os.getenv("BLOG_CACHE_TTL", "60"))
+BLOG_CACHE_MAX_ENTRIES = int(os.getenv("BLOG_CACHE_MAX_ENTRIES", "256"))
+
+# Estatísticas do admin: o retrato é refeito em segundo plano depois de ADMIN_STATS_TTL segundos
+# e nunca é servido com mais de ADMIN_STATS_MAX_STALE segundos (aí a requisição espera o novo)
+ADMIN_STATS_TTL = int(os.getenv("ADMIN_STATS_TTL", "30"))
+ADMIN_STATS_MAX_STALE = int(os.getenv("ADMIN_STATS_MAX_STALE", "300"))
+
+# E-mails (separados por vírgula) das contas com acesso de administrador na API
+ADMIN_EMAILS = [e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()]
+
 # Configurações de CORS (origens permitidas)
 ALLOWED_ORIGINS = [
     "https://tramagrid.com.br",
@@ -30,4 +42,29 @@ ALLOWED_ORIGINS = [
 # Configurações gerais
 DATA_DIR = "data"
 
+# Limites de upload: imagens acima de MAX_UPLOAD_PIXELS são recusadas antes de decodificar; a cópia
+# de trabalho (usada para gerar a grade) tem no máximo WORKING_COPY_MAX_SIDE px no maior lado
+MAX_GRID_WIDTH_CELLS = int(os.getenv("MAX_GRID_WIDTH_CELLS", "400"))
+MAX_UPLOAD_PIXELS = int(os.getenv("MAX_UPLOAD_PIXELS", str(64 * 1000 * 1000)))
+WORKING_COPY_MAX_SIDE = int(os.getenv("WORKING_COPY_MAX_SIDE", str(4 * MAX_GRID_WIDTH_CELLS)))
+
+# Orçamento de memória (MB) das sessões mantidas vivas pelo gerenciador de sessões
+SESSION_CACHE_MB = int(os.getenv("SESSION_CACHE_MB", "1024"))
+
+# Trabalho pesado (gerar grade, exportar) em processos separados: tamanho do pool, quantos jobs
+# podem esperar na fila antes de responder 503 e o tamanho mínimo (px da imagem de entrada) para
+# valer a pena sair do processo web (abaixo disso roda ali mesmo; HEAVY_WORKERS=0 desliga o pool)
+HEAVY_WORKERS = int(os.getenv("HEAVY_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+HEAVY_QUEUE_MAX = int(os.getenv("HEAVY_QUEUE_MAX", "8"))
+OFFLOAD_MIN_PIXELS = int(os.getenv("OFFLOAD_MIN_PIXELS", str(250 * 1000)))
+
+# Grade servida em binário (/api/grid): nível zlib do PNG (0-9) e esforço do WebP sem perdas (0-6).
+# Em gráficos de ponto o nível 6 do PNG custa o mesmo que o 1 e sai bem menor; o WebP sai ~4x menor.
+GRID_PNG_COMPRESS_LEVEL = int(os.getenv("GRID_PNG_COMPRESS_LEVEL", "6"))
+GRID_WEBP_METHOD = int(os.getenv("GRID_WEBP_METHOD", "2"))
+
+# Cache de resultados da exportação em segundo plano (PDF/PNG) por hash do conteúdo
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "export_cache")
+EXPORT_CACHE_MB = int(os.getenv("EXPORT_CACHE_MB", "512"))
+
 print("Configuracoes carregadas com sucesso!")
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Converte as sessões gravadas no formato antigo (meta.json + PNGs) para o contêiner session.bin
+
+Uso: python convert_sessions.py [DATA_DIR]
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from config import DATA_DIR
+from services.tramagrid.storage import convert_legacy_dir
+
+def run(data_dir: str) -> None:
+    converted = skipped = failed = 0
+    for name in sorted(os.listdir(data_dir)):
+        s_dir = os.path.join(data_dir, name)
+        if not os.path.isdir(s_dir):
+            continue
+        try:
+            if convert_legacy_dir(s_dir):
+                converted += 1
+            else:
+                skipped += 1
+        except Exception as e:
+            failed += 1
+            print(f"Erro ao converter {name}: {e}")
+    print(f"Convertidas: {converted}  Ignoradas: {skipped}  Falhas: {failed}")
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else DATA_DIR)
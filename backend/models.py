@@ -4,6 +4,7 @@ from typing import Optional, List, Dict, Any
 # Modelos para parâmetros de atualização
 class ParamsUpdate(BaseModel):
     max_colors: Optional[int] = None
+    quantizer: Optional[str] = None
     grid_width_cells: Optional[int] = None
     brightness: Optional[float] = None
     contrast: Optional[float] = None
@@ -49,6 +50,22 @@ class RegRep(BaseModel):
     from_index: int
     to_index: int
 
+# Modelo para troca de índices por tabela em uma região (ou fora dela, com invert)
+class RegionRemap(BaseModel):
+    x: int
+    y: int
+    w: int
+    h: int
+    table: Dict[int, int]
+    invert: bool = False
+
+# Modelo para preenchimento de região contígua (balde)
+class Fill(BaseModel):
+    x: int
+    y: int
+    color_index: int
+    connectivity: int = 4
+
 # Modelo para checkout do Stripe
 class CheckoutSession(BaseModel):
     quantity: int
@@ -63,6 +80,15 @@ class BatchMerge(BaseModel):
     to_index: int
     from_indices: List[int]
 
+# Modelo para uma operação de um lote de edições (nome do método + argumentos posicionais)
+class BatchOp(BaseModel):
+    op: str
+    args: List[Any] = []
+
+# Modelo para lote de edições aplicado como transação
+class EditBatch(BaseModel):
+    ops: List[BatchOp]
+
 # Modelo para post do blog
 class BlogPostModel(BaseModel):
     title: str
@@ -1,63 +1,36 @@
-from fastapi import APIRouter
-from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
 
 # Imports com fallback para execução direta
 try:
     from ..config import SUPABASE_URL, SUPABASE_SERVICE_KEY
-    from ..services.db import get_supabase_admin
+    from ..services.db import get_supabase_admin, get_admin_stats, is_admin_token, EMPTY_STATS
 except ImportError:
     # Fallback quando executado fora do pacote
     import sys
     import os
     sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
     from config import SUPABASE_URL, SUPABASE_SERVICE_KEY
-    from services.db import get_supabase_admin
+    from services.db import get_supabase_admin, get_admin_stats, is_admin_token, EMPTY_STATS
 
 router = APIRouter()
 
 @router.get("/admin/stats")
-def get_admin_stats():
-    """Retorna estatísticas do admin com contagens reais"""
+def admin_stats(refresh: bool = False, authorization: Optional[str] = Header(None)):
+    """Retorna estatísticas do admin com contagens reais
+
+    `refresh=true` ignora o retrato em cache e refaz as consultas na hora: só para administradores
+    (Authorization: Bearer <token de acesso do Supabase>).
+    """
     # Verificação de segurança: só executa se as credenciais do Supabase estiverem configuradas
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-        return {"total_users": 0, "total_projects": 0, "daily_visits": 0, "daily_logins": 0}
-
-    try:
-        supabase_admin = get_supabase_admin()
-        count_users = 0
-        count_projects = 0
-
-        # Contagens Totais
-        if supabase_admin:
-            res_u = supabase_admin.table('profiles').select('id', count='exact').execute()
-            count_users = res_u.count if res_u.count else 0
-            res_p = supabase_admin.table('projects').select('id', count='exact').execute()
-            count_projects = res_p.count if res_p.count else 0
-
-        # Estatísticas do Dia (Visitas e Logins)
-        visits = 0
-        logins = 0
+        return dict(EMPTY_STATS)
 
-        if supabase_admin:
-            try:
-                today = datetime.now().strftime('%Y-%m-%d')
-                res_stats = supabase_admin.table('daily_stats').select('*').eq('date', today).single().execute()
-                if res_stats.data:
-                    visits = res_stats.data.get('visits', 0)
-                    logins = res_stats.data.get('logins', 0)
-            except:
-                pass
-
-        return {
-            "total_users": count_users,
-            "total_projects": count_projects,
-            "daily_visits": visits,
-            "daily_logins": logins,
-            "new_subs": 0  # Placeholder até implementar Stripe webhooks
-        }
-    except Exception as e:
-        print(f"Stats Error: {e}")
-        return {"total_users": 0, "total_projects": 0, "daily_visits": 0, "daily_logins": 0}
+    if refresh:
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not is_admin_token(token.strip()):
+            raise HTTPException(403, "Apenas administradores podem forçar a atualização.")
+    return get_admin_stats(force=refresh)
 
 @router.post("/track/visit")
 def track_visit():
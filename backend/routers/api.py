@@ -1,7 +1,270 @@
-from fastapi import APIRouter
+import json
+import zlib
+from typing import Dict, Optional, Set
+from fastapi import APIRouter, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+# Imports com fallback para execução direta
+try:
+    from ..models import EditBatch, Fill, RegionRemap
+    from ..services.tramagrid.manager import session_manager, SessionNotFound
+    from ..services.tramagrid.export_jobs import export_queue
+    from ..services.tramagrid.offload import heavy_pool
+    from ..services.tramagrid.live import apply_message
+    from ..services.tramagrid.grid import GRID_FORMATS
+    from ..services.tramagrid.plane import pack_plane
+except ImportError:
+    # Fallback quando executado fora do pacote
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+    from models import EditBatch, Fill, RegionRemap
+    from services.tramagrid.manager import session_manager, SessionNotFound
+    from services.tramagrid.export_jobs import export_queue
+    from services.tramagrid.offload import heavy_pool
+    from services.tramagrid.live import apply_message
+    from services.tramagrid.grid import GRID_FORMATS
+    from services.tramagrid.plane import pack_plane
 
 router = APIRouter()
 
+def open_session(sid: str):
+    """Abre a sessão com lock exclusivo (`with open_session(sid) as s:`), carregando do disco se preciso"""
+    try:
+        return session_manager.use(sid)
+    except SessionNotFound:
+        raise HTTPException(404, "Sessão não encontrada.")
+
 @router.get("/test")
 def test_endpoint():
     return {"message": "API router funcionando!"}
+
+@router.post("/session")
+def create_session():
+    """Cria uma nova sessão"""
+    sid, _ = session_manager.create()
+    return {"session_id": sid}
+
+@router.get("/sessions/stats")
+def session_stats():
+    """Ocupação e contadores de acerto/falha do cache de sessões"""
+    return session_manager.stats()
+
+@router.get("/workers/stats")
+def worker_stats():
+    """Ocupação do pool de trabalho pesado (jobs em andamento, capacidade e recusas por 503)"""
+    return heavy_pool.stats()
+
+@router.post("/batch/{sid}")
+def batch(sid: str, body: EditBatch):
+    """Aplica várias edições (ex.: um traço de pincel) em uma única transação"""
+    with open_session(sid) as s:
+        try:
+            results = s.apply_batch([op.dict() for op in body.ops])
+        except (ValueError, TypeError, KeyError) as e:
+            raise HTTPException(400, f"Lote rejeitado: {e}")
+        s.save_to_disk(sid, lite=True)
+    return {"ok": True, "results": results}
+
+@router.post("/remap/{sid}")
+def remap(sid: str, body: RegionRemap):
+    """Troca índices por uma tabela dentro (ou fora) de um retângulo"""
+    with open_session(sid) as s:
+        try:
+            s.remap_region(body.x, body.y, body.w, body.h, body.table, body.invert)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        s.save_to_disk(sid, lite=True)
+    return {"ok": True}
+
+@router.post("/fill/{sid}")
+def fill(sid: str, body: Fill):
+    """Balde de tinta: pinta a região contígua e devolve a caixa alterada"""
+    with open_session(sid) as s:
+        try:
+            bbox = s.flood_fill(body.x, body.y, body.color_index, body.connectivity)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if bbox:
+            s.save_to_disk(sid, lite=True)
+    return {"ok": True, "bbox": bbox}
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """O cliente já tem esta versão? (If-None-Match com uma ou mais ETags, ou *)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+@router.get("/grid/{sid}")
+def grid(sid: str, request: Request, fmt: str = Query("png", alias="format"), level: Optional[int] = None):
+    """Grade em PNG ou WebP sem perdas (bytes crus), com ETag; revalidar sem mudança dá 304 sem codificar"""
+    with open_session(sid) as s:
+        try:
+            etag = s.grid_etag(fmt, level)
+            if etag_matches(request, etag):
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+            etag, data = s.encode_grid(fmt, level)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    if not data:
+        raise HTTPException(404, "Grade não gerada.")
+    return Response(content=data, media_type=GRID_FORMATS[fmt][0],
+                    headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/plane/{sid}")
+def plane(sid: str, request: Request, encoding: str = "zlib", since: Optional[str] = None):
+    """Plano de índices + paleta em binário, para o cliente desenhar o gráfico sozinho
+
+    Corpo: b"TGPL", tamanho do cabeçalho (uint32 LE), cabeçalho JSON e os dados. Com
+    `since=<versão que o cliente tem>` os dados cobrem só a caixa alterada desde então.
+    """
+    with open_session(sid) as s:
+        try:
+            header, data = s.encode_plane(encoding, since)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    body = pack_plane(header, data)
+    headers = {"X-Plane-Version": header["version"], "Cache-Control": "no-cache"}
+    if header["full"]:
+        # O plano inteiro é uma representação estável: revalidável por ETag (inclui a paleta)
+        etag = f'"{header["version"]}-{encoding}-{zlib.crc32(json.dumps(header["palette"]).encode()):08x}"'
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, **headers})
+        headers["ETag"] = etag
+    return Response(content=body, media_type="application/octet-stream", headers=headers)
+
+@router.get("/rows/{sid}")
+def rows(sid: str, start: int = 1, limit: int = 200):
+    """Instruções carreira a carreira, paginadas, em NDJSON (cabeçalho e depois uma carreira por linha)"""
+    with open_session(sid) as s:
+        page = s.get_rows_page(start, limit)
+    # Serializa fora do lock da sessão, carreira por carreira
+    records = [page["header"]] + page["lines"]
+    headers = {"X-Next-Start": str(page["header"]["next"])} if page["header"]["next"] else {}
+    return StreamingResponse((json.dumps(r, ensure_ascii=False) + "\n" for r in records),
+                             media_type="application/x-ndjson", headers=headers)
+
+@router.get("/tiles/{sid}")
+def tile_info(sid: str):
+    """Descreve os níveis de zoom e a quantidade de tiles da grade"""
+    with open_session(sid) as s:
+        return s.get_tile_info()
+
+@router.get("/tiles/{sid}/{z}/{tx}/{ty}.png")
+def tile(sid: str, z: int, tx: int, ty: int, request: Request):
+    """Retorna um tile PNG da grade (renderizado direto do plano de índices), com ETag por tile"""
+    with open_session(sid) as s:
+        try:
+            etag = s.tile_etag(z, tx, ty)  # Confere z/tx/ty antes de tudo
+        except ValueError as e:
+            raise HTTPException(404, str(e))
+        # Tiles mudam a cada edição: o cliente sempre revalida, e o que não mudou dá 304
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        data = s.get_tile_png(z, tx, ty)
+    return Response(content=data, media_type="image/png", headers=headers)
+
+@router.post("/export/{sid}")
+def export_submit(sid: str, kind: str = "pdf"):
+    """Enfileira a exportação (pdf ou png) e devolve o id do job; resultado em cache sai pronto
+
+    Com o pool de trabalho pesado cheio, responde 503 (ver app.py).
+    """
+    with open_session(sid) as s:
+        try:
+            return export_queue.submit(s, kind)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+@router.get("/export/jobs/{job_id}")
+def export_status(job_id: str):
+    """Status e progresso de um job de exportação"""
+    status = export_queue.status(job_id)
+    if status is None:
+        raise HTTPException(404, "Job não encontrado.")
+    return status
+
+@router.get("/export/jobs/{job_id}/result")
+def export_result(job_id: str):
+    """Arquivo gerado por um job concluído"""
+    result = export_queue.result(job_id)
+    if result is None:
+        raise HTTPException(404, "Resultado não disponível.")
+    path, media_type = result
+    with open(path, "rb") as f:
+        data = f.read()
+    filename = f"tramagrid.{path.rsplit('.', 1)[1]}"
+    return Response(content=data, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Conexões abertas do canal de edição, por sessão (o diff de uma edição vai para todas)
+_channels: Dict[str, Set[WebSocket]] = {}
+
+def _channel_hello(sid: str) -> Dict:
+    with open_session(sid) as s:
+        return {"version": s.grid_version, "reset": True}
+
+def _channel_edit(sid: str, msg: Dict) -> Dict:
+    with open_session(sid) as s:
+        result = apply_message(s, msg)
+        if len(result) > 1:
+            s.save_to_disk(sid, lite=True)
+    return result
+
+@router.websocket("/ws/{sid}")
+async def edit_channel(ws: WebSocket, sid: str):
+    """Canal de edição: recebe {"id", "op", "args"} (ou {"id", "ops": [...]}) e responde só o que mudou
+
+    A resposta traz células [x, y, índice] (ou um retângulo de índices), cores alteradas da
+    paleta e os tiles a buscar de novo; as outras conexões da mesma sessão recebem o mesmo diff.
+    """
+    await ws.accept()
+    try:
+        hello = await run_in_threadpool(_channel_hello, sid)
+    except HTTPException:
+        await ws.close(code=4404)
+        return
+    await ws.send_json(hello)
+
+    peers = _channels.setdefault(sid, set())
+    peers.add(ws)
+    try:
+        while True:
+            try:
+                msg = json.loads(await ws.receive_text())
+            except ValueError:
+                msg = None
+            if not isinstance(msg, dict):
+                await ws.send_json({"ok": False, "error": "Mensagem inválida"})
+                continue
+            # Edição com falha vira resposta de erro; a conexão continua aberta
+            try:
+                result = await run_in_threadpool(_channel_edit, sid, msg)
+            except HTTPException as e:
+                await ws.send_json({"id": msg.get("id"), "ok": False, "error": e.detail})
+                continue
+            except (ValueError, TypeError, KeyError) as e:
+                await ws.send_json({"id": msg.get("id"), "ok": False, "error": str(e)})
+                continue
+            except Exception as e:
+                print(f"Erro no canal de edição {sid}: {e}")
+                await ws.send_json({"id": msg.get("id"), "ok": False, "error": "Erro ao aplicar a edição"})
+                continue
+            await ws.send_json({"id": msg.get("id"), "ok": True, **result})
+            if len(result) > 1:
+                for peer in list(peers):
+                    if peer is not ws:
+                        try:
+                            await peer.send_json(result)
+                        except Exception:
+                            peers.discard(peer)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        peers.discard(ws)
+        if not peers:
+            _channels.pop(sid, None)
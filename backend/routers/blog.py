@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 
 # Imports com fallback para execução direta
 try:
     from ..config import SUPABASE_URL, SUPABASE_SERVICE_KEY
     from ..models import BlogPostModel
-    from ..services.db import get_posts, get_post, create_post, delete_post, get_supabase_admin
+    from ..services.db import get_posts_entry, get_post_entry, parse_posts_cursor, POSTS_PAGE_SIZE, create_post, delete_post, get_supabase_admin
 except ImportError:
     # Fallback quando executado fora do pacote
     import sys
@@ -12,30 +15,70 @@ except ImportError:
     sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
     from config import SUPABASE_URL, SUPABASE_SERVICE_KEY
     from models import BlogPostModel
-    from services.db import get_posts, get_post, create_post, delete_post, get_supabase_admin
+    from services.db import get_posts_entry, get_post_entry, parse_posts_cursor, POSTS_PAGE_SIZE, create_post, delete_post, get_supabase_admin
 
 router = APIRouter()
 
+def cached_response(request: Request, entry, content=None, extra_headers=None) -> Response:
+    """Resposta com ETag/Last-Modified; 304 sem corpo se o cliente já tem esta versão
+
+    O corpo é `content` (padrão: o valor em cache inteiro).
+    """
+    headers = {
+        **(extra_headers or {}),
+        "ETag": entry.etag,
+        "Last-Modified": format_datetime(entry.last_modified, usegmt=True),
+        # Navegadores e CDNs podem guardar, mas sempre revalidam (barato: 304)
+        "Cache-Control": "public, no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if "*" in tags or entry.etag in tags or f"W/{entry.etag}" in tags:
+            return Response(status_code=304, headers=headers)
+    else:
+        try:
+            since = parsedate_to_datetime(request.headers.get("if-modified-since", ""))
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and since.tzinfo is not None and entry.last_modified <= since:
+            return Response(status_code=304, headers=headers)
+    return JSONResponse(content=entry.value if content is None else content, headers=headers)
+
 @router.get("/posts")
-def list_posts():
-    """Lista todos os posts publicados"""
+def list_posts(request: Request, limit: int = POSTS_PAGE_SIZE, before: Optional[str] = None):
+    """Lista posts publicados, mais recentes primeiro, só com os campos dos cards
+
+    Paginada por cursor: o cabeçalho X-Next-Cursor (ausente na última página) vai em `before`
+    para buscar a próxima. O conteúdo completo vem de /posts/{slug}.
+    """
     # Verificação de segurança: só executa se as credenciais do Supabase estiverem configuradas
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         raise HTTPException(500, "Serviço de banco de dados indisponível")
 
-    return get_posts()
+    if before:
+        try:
+            parse_posts_cursor(before)
+        except ValueError:
+            raise HTTPException(400, "Cursor inválido")
+
+    entry = get_posts_entry(limit, before)
+    if entry is None:
+        return []
+    nxt = entry.value["next"]
+    return cached_response(request, entry, entry.value["items"], {"X-Next-Cursor": nxt} if nxt else None)
 
 @router.get("/posts/{slug}")
-def get_single_post(slug: str):
+def get_single_post(slug: str, request: Request):
     """Retorna um post específico pelo slug"""
     # Verificação de segurança: só executa se as credenciais do Supabase estiverem configuradas
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         raise HTTPException(500, "Serviço de banco de dados indisponível")
 
-    post = get_post(slug)
-    if not post:
+    entry = get_post_entry(slug)
+    if entry is None:
         raise HTTPException(404, "Post não encontrado")
-    return post
+    return cached_response(request, entry)
 
 @router.post("/posts")
 def create_new_post(post: BlogPostModel):
@@ -1,12 +1,22 @@
 from supabase import create_client, Client
-from datetime import datetime
+from datetime import datetime, timezone
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
 # Import direto para evitar problemas de módulos
 import sys
 import os
 backend_path = os.path.dirname(os.path.dirname(__file__))
 sys.path.insert(0, backend_path)
 
-from config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from config import (
+    SUPABASE_URL, SUPABASE_SERVICE_KEY, BLOG_CACHE_TTL, BLOG_CACHE_MAX_ENTRIES,
+    ADMIN_STATS_TTL, ADMIN_STATS_MAX_STALE, ADMIN_EMAILS
+)
 
 # Conexão global do Supabase Admin
 supabase_admin: Client = None
@@ -29,23 +39,147 @@ def init_supabase_connection():
         print(f"Erro ao conectar Supabase: {e}")
         supabase_admin = None
 
-def get_posts():
-    """Retorna posts do blog mais recentes primeiro"""
+class CacheEntry(NamedTuple):
+    value: Any
+    etag: str                # ETag forte do conteúdo (hash do JSON)
+    last_modified: datetime  # Quando este conteúdo foi visto pela primeira vez
+    expires: float
+
+class TTLCache:
+    """Cache de leitura com validade (TTL), limite de entradas (LRU) e uma busca por chave por vez
+
+    OTIMIZAÇÃO: Picos de acesso ao blog (um post compartilhado) viram no máximo uma consulta ao
+    Supabase por chave a cada TTL: quem chega enquanto a busca está em andamento espera por ela
+    em vez de repetir a consulta. As escritas limpam o cache (invalidate); entre processos
+    diferentes, a defasagem máxima é o TTL.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def _fresh(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            self._entries.move_to_end(key)
+            return entry
+        return None
+
+    def get(self, key: str, loader: Callable[[], Any]) -> CacheEntry:
+        """Entrada em cache para `key`, buscando com loader() se faltar ou tiver vencido
+
+        Exceções do loader não são guardadas (a próxima leitura tenta de novo).
+        """
+        with self._lock:
+            entry = self._fresh(key)
+            if entry is not None:
+                return entry
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._fresh(key)
+                if entry is not None:
+                    return entry
+                generation = self._generation
+            try:
+                value = loader()
+                etag = '"' + hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest() + '"'
+                with self._lock:
+                    old = self._entries.get(key)
+                    # Conteúdo igual ao anterior: a data de modificação não anda
+                    modified = old.last_modified if old is not None and old.etag == etag else datetime.now(timezone.utc).replace(microsecond=0)
+                    entry = CacheEntry(value, etag, modified, time.monotonic() + self.ttl)
+                    if generation == self._generation:  # Uma escrita no meio da busca: não guarda
+                        self._entries[key] = entry
+                        self._entries.move_to_end(key)
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+            finally:
+                # Mesmo com o loader falhando, o lock da busca não pode ficar para trás
+                with self._lock:
+                    if self._loading.get(key) is key_lock:
+                        del self._loading[key]
+            return entry
+
+    def invalidate(self) -> None:
+        """Descarta tudo (chamado depois de cada escrita)"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+# Cache das leituras do blog (páginas da lista e posts por slug)
+blog_cache = TTLCache(BLOG_CACHE_TTL, BLOG_CACHE_MAX_ENTRIES)
+
+# Campos da listagem (cards do blog e do admin); o conteúdo completo só vem por slug
+POST_LIST_FIELDS = "id,title,slug,excerpt,image_url,created_at"
+POSTS_PAGE_SIZE = 20
+POSTS_MAX_PAGE_SIZE = 100
+
+def parse_posts_cursor(before: str) -> Tuple[str, str]:
+    """(created_at, id) de um cursor "created_at|id"; levanta ValueError se estiver malformado"""
+    created_at, sep, post_id = before.rpartition("|")
+    if not sep or not post_id or not all(c.isalnum() or c == "-" for c in post_id):
+        raise ValueError("Cursor inválido")
+    datetime.fromisoformat(created_at)
+    return created_at, post_id
+
+def _fetch_posts(limit: int, before: Optional[str]):
+    """Uma página da lista (mais recentes primeiro) e o cursor da próxima ("created_at|id" do último)
+
+    OTIMIZAÇÃO: Só os campos dos cards, com paginação por cursor em (created_at, id) (usa o
+    índice da ordenação; o custo não cresce com o número de páginas como um offset). O id
+    desempata posts com o mesmo created_at, que senão seriam pulados na virada de página.
+    """
+    query = supabase_admin.table('posts').select(POST_LIST_FIELDS).eq('published', True)
+    if before:
+        created_at, post_id = parse_posts_cursor(before)
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{post_id})')
+    # Um a mais só para saber se existe próxima página
+    res = query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1).execute()
+    items = res.data[:limit]
+    nxt = f"{items[-1]['created_at']}|{items[-1]['id']}" if len(res.data) > limit else None
+    return {"items": items, "next": nxt}
+
+def _fetch_post(slug: str):
+    # maybe_single: slug inexistente vira None (guardado no cache pelo TTL), não uma exceção
+    res = supabase_admin.table('posts').select('*').eq('slug', slug).maybe_single().execute()
+    return res.data if res is not None else None
+
+def get_posts_entry(limit: int = POSTS_PAGE_SIZE, before: Optional[str] = None) -> Optional[CacheEntry]:
+    """Página de posts publicados ({"items", "next"}) com ETag/data de modificação, ou None em caso de erro
+
+    `before` é o cursor devolvido pela página anterior ("created_at|id" do último post dela).
+    """
+    limit = max(1, min(limit, POSTS_MAX_PAGE_SIZE))
     try:
-        res = supabase_admin.table('posts').select('*').eq('published', True).order('created_at', desc=True).execute()
-        return res.data
+        return blog_cache.get(f"posts:{limit}:{before or ''}", lambda: _fetch_posts(limit, before))
     except Exception as e:
         print(f"Erro ao buscar posts: {e}")
-        return []
+        return None
 
-def get_post(slug: str):
-    """Retorna um post específico pelo slug"""
+def get_post_entry(slug: str) -> Optional[CacheEntry]:
+    """Um post pelo slug com ETag/data de modificação, ou None se não existir (ou em caso de erro)"""
     try:
-        res = supabase_admin.table('posts').select('*').eq('slug', slug).single().execute()
-        return res.data
+        entry = blog_cache.get(f"post:{slug}", lambda: _fetch_post(slug))
     except Exception as e:
         print(f"Erro ao buscar post {slug}: {e}")
         return None
+    return entry if entry.value else None
+
+def get_posts(limit: int = POSTS_PAGE_SIZE, before: Optional[str] = None):
+    """Retorna uma página de posts do blog (campos da listagem), mais recentes primeiro"""
+    entry = get_posts_entry(limit, before)
+    return entry.value["items"] if entry is not None else []
+
+def get_post(slug: str):
+    """Retorna um post específico pelo slug"""
+    entry = get_post_entry(slug)
+    return entry.value if entry is not None else None
 
 def create_post(post_data: dict):
     """Cria um novo post"""
@@ -55,6 +189,8 @@ def create_post(post_data: dict):
     except Exception as e:
         print(f"Erro ao criar post: {e}")
         raise Exception(str(e))
+    finally:
+        blog_cache.invalidate()
 
 def delete_post(post_id: int):
     """Deleta um post"""
@@ -64,6 +200,8 @@ def delete_post(post_id: int):
     except Exception as e:
         print(f"Erro ao deletar post {post_id}: {e}")
         raise Exception(str(e))
+    finally:
+        blog_cache.invalidate()
 
 def get_user_profile(user_id: str):
     """Busca o perfil do usuário"""
@@ -83,41 +221,118 @@ def update_user_credits(user_id: str, credits: int):
         print(f"Erro ao atualizar créditos do usuário {user_id}: {e}")
         raise Exception(f"Update Error: {e}")
 
-def get_admin_stats():
-    """Retorna estatísticas do admin com contagens reais"""
+EMPTY_STATS = {"total_users": 0, "total_projects": 0, "daily_visits": 0, "daily_logins": 0}
+
+def _count(table: str) -> int:
+    # head=True: só a contagem, sem trazer as linhas
+    res = supabase_admin.table(table).select('id', count='exact', head=True).execute()
+    return res.count if res.count else 0
+
+def _daily_stats(today: str):
     try:
-        # Conta usuários
-        res_users = supabase_admin.table('profiles').select('id', count='exact').execute()
-        count_users = res_users.count if res_users.count else 0
+        res = supabase_admin.table('daily_stats').select('visits,logins').eq('date', today).single().execute()
+        return res.data or {}
+    except Exception:
+        return {}  # Nenhuma linha para hoje ainda
 
-        # Conta projetos
-        res_projects = supabase_admin.table('projects').select('id', count='exact').execute()
-        count_projects = res_projects.count if res_projects.count else 0
+# As três consultas do painel rodam em paralelo (uma ida e volta em vez de três)
+_stats_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="admin-stats")
 
-        # Estatísticas do dia (Visitas e Logins)
-        visits = 0
-        logins = 0
+def _load_admin_stats(today: str) -> Dict[str, Any]:
+    users = _stats_pool.submit(_count, 'profiles')
+    projects = _stats_pool.submit(_count, 'projects')
+    daily = _stats_pool.submit(_daily_stats, today)
+    day = daily.result()
+    return {
+        "total_users": users.result(),
+        "total_projects": projects.result(),
+        "daily_visits": day.get('visits', 0),
+        "daily_logins": day.get('logins', 0),
+        "new_subs": 0  # Placeholder até implementar Stripe webhooks
+    }
 
-        if supabase_admin:
-            try:
-                today = datetime.now().strftime('%Y-%m-%d')
-                res_stats = supabase_admin.table('daily_stats').select('*').eq('date', today).single().execute()
-                if res_stats.data:
-                    visits = res_stats.data.get('visits', 0)
-                    logins = res_stats.data.get('logins', 0)
-            except:
-                pass
-
-        return {
-            "total_users": count_users,
-            "total_projects": count_projects,
-            "daily_visits": visits,
-            "daily_logins": logins,
-            "new_subs": 0  # Placeholder até implementar Stripe webhooks
-        }
+class StatsSnapshot:
+    """Retrato das estatísticas do admin, refeito periodicamente
+
+    OTIMIZAÇÃO: Até `ttl` segundos o retrato é servido direto da memória; entre `ttl` e
+    `max_stale` ele ainda é servido, e uma única atualização roda em segundo plano; passado
+    `max_stale` (ou na virada do dia, ou com force=True) a requisição espera o retrato novo.
+    Se a atualização falhar, o retrato anterior continua valendo até `max_stale`.
+    """
+
+    def __init__(self, ttl: float, max_stale: float):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._stats: Optional[Dict[str, Any]] = None
+        self._taken = 0.0   # time.monotonic() do retrato
+        self._as_of = ""    # Horário do retrato (ISO, UTC) devolvido ao cliente
+        self._day = ""
+        self._refresh_lock = threading.Lock()
+
+    def _refresh(self, today: str) -> None:
+        stats = _load_admin_stats(today)
+        self._stats, self._taken, self._day = stats, time.monotonic(), today
+        self._as_of = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+    def _refresh_background(self, today: str) -> None:
+        try:
+            self._refresh(today)
+        except Exception as e:
+            print(f"Erro ao atualizar stats: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def get(self, force: bool = False) -> Dict[str, Any]:
+        today = datetime.now().strftime('%Y-%m-%d')
+        age = time.monotonic() - self._taken
+        usable = self._stats is not None and self._day == today and not force
+
+        if usable and age < self.ttl:
+            return self._response(age)
+        if usable and age < self.max_stale:
+            # Serve o retrato atual e atualiza em segundo plano (uma atualização por vez)
+            if self._refresh_lock.acquire(blocking=False):
+                threading.Thread(target=self._refresh_background, args=(today,), daemon=True).start()
+            return self._response(age)
+
+        with self._refresh_lock:
+            # Outra requisição pode ter acabado de atualizar enquanto esta esperava
+            if force or self._stats is None or self._day != today or time.monotonic() - self._taken >= self.ttl:
+                try:
+                    self._refresh(today)
+                except Exception as e:
+                    # Atualização forçada que falhou: serve o retrato anterior se ele ainda vale
+                    if not (force and self._stats is not None and self._day == today
+                            and time.monotonic() - self._taken < self.max_stale):
+                        raise
+                    print(f"Erro ao atualizar stats: {e}")
+        return self._response(time.monotonic() - self._taken)
+
+    def _response(self, age: float) -> Dict[str, Any]:
+        return {**self._stats, "as_of": self._as_of, "age_seconds": int(age)}
+
+admin_stats = StatsSnapshot(ADMIN_STATS_TTL, ADMIN_STATS_MAX_STALE)
+
+def get_admin_stats(force: bool = False):
+    """Retorna estatísticas do admin com contagens reais (retrato em cache; force=True refaz na hora)"""
+    if not supabase_admin:
+        return dict(EMPTY_STATS)
+    try:
+        return admin_stats.get(force)
     except Exception as e:
         print(f"Erro ao buscar stats: {e}")
-        return {"total_users": 0, "total_projects": 0, "daily_visits": 0, "daily_logins": 0}
+        return dict(EMPTY_STATS)
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """O token de acesso (JWT do Supabase Auth) é de uma conta listada em ADMIN_EMAILS?"""
+    if not token or not supabase_admin or not ADMIN_EMAILS:
+        return False
+    try:
+        user = supabase_admin.auth.get_user(token).user
+    except Exception as e:
+        print(f"Erro ao validar token: {e}")
+        return False
+    return bool(user and user.email and user.email.lower() in ADMIN_EMAILS)
 
 def increment_visit():
     """Incrementa contador de visitas"""
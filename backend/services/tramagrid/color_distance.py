@@ -0,0 +1,67 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Distância perceptual entre cores da paleta: ΔE (CIE76), ou seja, distância euclidiana em CIELAB
+# (sRGB, iluminante D65). A paleta é convertida uma vez e a matriz ΔE de todos os pares é
+# calculada de uma vez com numpy; vizinho mais próximo e agrupamento por limiar saem dela.
+
+# Limiar padrão de agrupamento (ΔE ~ 20: cores que parecem a mesma em um gráfico de ponto)
+DEFAULT_CLUSTER_DELTA_E = 20.0
+
+_SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+def rgb_to_lab(rgb) -> np.ndarray:
+    """Converte cores RGB 0..255 (N x 3) para CIELAB"""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    c = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = (c @ _SRGB_TO_XYZ.T) / _WHITE_D65
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+class PaletteDistances:
+    """Paleta pré-convertida para CIELAB com a matriz ΔE de todos os pares (na ordem da paleta)"""
+
+    def __init__(self, items: Tuple[Tuple[int, Tuple[int, int, int]], ...]):
+        self.indices = [idx for idx, _ in items]
+        self.position = {idx: i for i, idx in enumerate(self.indices)}
+        self.lab = rgb_to_lab([rgb for _, rgb in items]) if items else np.zeros((0, 3))
+        diff = self.lab[:, None, :] - self.lab[None, :, :]
+        self.matrix = np.sqrt((diff * diff).sum(-1))
+
+    def nearest(self, idx: int) -> Optional[int]:
+        """Índice da cor mais próxima de `idx` (sem contar ela mesma); empate fica com a primeira"""
+        i = self.position.get(idx)
+        if i is None or len(self.indices) < 2:
+            return None
+        row = self.matrix[i].copy()
+        row[i] = np.inf
+        return self.indices[int(row.argmin())]
+
+    def clusters(self, threshold: float) -> List[List[int]]:
+        """Grupos de cores a menos de `threshold` ΔE da primeira cor do grupo (varredura gulosa na ordem da paleta)"""
+        close = self.matrix < threshold
+        free = np.ones(len(self.indices), dtype=bool)
+        groups = []
+        for i in range(len(self.indices)):
+            if not free[i]:
+                continue
+            members = np.nonzero(close[i, i + 1:] & free[i + 1:])[0] + i + 1
+            if len(members):
+                free[members] = False
+                free[i] = False
+                groups.append([self.indices[i]] + [self.indices[j] for j in members])
+        return groups
+
+@lru_cache(maxsize=16)
+def _distances(items: Tuple[Tuple[int, Tuple[int, int, int]], ...]) -> PaletteDistances:
+    return PaletteDistances(items)
+
+def palette_distances(palette: Dict[int, Tuple[int, int, int]]) -> PaletteDistances:
+    """Distâncias da paleta, reaproveitadas enquanto ela não muda"""
+    return _distances(tuple((idx, tuple(rgb)) for idx, rgb in palette.items()))
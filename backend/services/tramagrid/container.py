@@ -0,0 +1,87 @@
+import io
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+# Arquivo único da sessão (substitui meta.json + quantized.png + original.png)
+CONTAINER_FILE = "session.bin"
+
+# Formato versionado:
+#   MAGIC | versão (u16) | tamanho do cabeçalho (u32) | cabeçalho JSON | padding até DATA_ALIGN
+#   plano de índices cru (largura * altura bytes, 1 por célula)
+#   original codificado (arquivo enviado ou PNG), opcional
+MAGIC = b"TGSESS"
+VERSION = 1
+DATA_ALIGN = 16
+_PREFIX = struct.Struct("<6sHI")
+
+class ContainerError(ValueError):
+    """Arquivo de sessão inválido ou de versão desconhecida"""
+
+def _data_offset(header_len: int) -> int:
+    end = _PREFIX.size + header_len
+    return (end + DATA_ALIGN - 1) // DATA_ALIGN * DATA_ALIGN
+
+def write_container(path: str, header: Dict, plane: Optional[Image.Image], original_blob: Optional[bytes]) -> None:
+    """Grava o contêiner de forma atômica (tmp + replace)"""
+    header = dict(header)
+    header["size"] = list(plane.size) if plane is not None else None
+    header["original_length"] = len(original_blob) if original_blob else 0
+    raw_header = json.dumps(header).encode("utf-8")
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(raw_header)))
+        f.write(raw_header)
+        f.write(b"\0" * (_data_offset(len(raw_header)) - _PREFIX.size - len(raw_header)))
+        if plane is not None:
+            f.write(plane.tobytes())
+        if original_blob:
+            f.write(original_blob)
+    os.replace(path + ".tmp", path)
+
+def read_container(path: str) -> Tuple[Dict, Optional[Image.Image], Optional[memoryview]]:
+    """Abre o contêiner sem decodificar nada: devolve o cabeçalho, o plano de índices e o original codificado
+
+    OTIMIZAÇÃO: O plano de índices é mapeado em memória (Image.frombuffer sobre o mmap). A imagem
+    fica somente-leitura e o Pillow faz a cópia na primeira edição; o original continua
+    codificado até alguém precisar dele (ver TramaGridSession.original).
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mm) < _PREFIX.size:
+        raise ContainerError("Arquivo de sessão truncado")
+    magic, version, header_len = _PREFIX.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ContainerError("Não é um arquivo de sessão")
+    if version != VERSION:
+        raise ContainerError(f"Versão de arquivo de sessão não suportada: {version}")
+
+    header = json.loads(bytes(mm[_PREFIX.size:_PREFIX.size + header_len]).decode("utf-8"))
+    offset = _data_offset(header_len)
+    view = memoryview(mm)
+
+    plane = None
+    if header.get("size"):
+        w, h = header["size"]
+        if offset + w * h > len(mm):
+            raise ContainerError("Plano de índices truncado")
+        plane = Image.frombuffer("P", (w, h), view[offset:offset + w * h], "raw", "P", 0, 1)
+        offset += w * h
+
+    original_blob = None
+    if header.get("original_length"):
+        n = header["original_length"]
+        if offset + n > len(mm):
+            raise ContainerError("Original truncado")
+        original_blob = view[offset:offset + n]
+
+    return header, plane, original_blob
+
+def encode_original(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
@@ -1,7 +1,7 @@
 import io
 import string
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Optional
 from PIL import Image
 from reportlab.lib.pagesizes import A4, landscape, portrait
 from reportlab.pdfgen import canvas as pdf_canvas
@@ -9,6 +9,8 @@ from reportlab.lib.units import cm
 from reportlab.lib.colors import HexColor
 from reportlab.lib.utils import ImageReader, simpleSplit
 
+from .rows import iter_lines, line_arrow
+
 if TYPE_CHECKING:
     from .session import TramaGridSession
 
@@ -22,12 +24,15 @@ def export_png(session: "TramaGridSession"):
     buf.seek(0)
     return buf
 
-def export_pdf(session: "TramaGridSession", sid: str):
-    """Exporta a grade como PDF"""
+def export_pdf(session: "TramaGridSession", sid: str, progress: Optional[Callable[[float], None]] = None):
+    """Exporta a grade como PDF (`progress`, se dado, recebe a fração concluída de 0 a 1)"""
     if not session.grid_image:
         raise ValueError("Grade não gerada")
+    report = progress or (lambda fraction: None)
 
-    is_landscape = session.grid_width_cells > session.quantized.height
+    # Dimensões da grade gerada (grid_width_cells é só o pedido, antes do limite do pipeline)
+    width, height = session.quantized.size
+    is_landscape = width > height
     page_size = landscape(A4) if is_landscape else portrait(A4)
     pg_w, pg_h = page_size
 
@@ -39,10 +44,10 @@ def export_pdf(session: "TramaGridSession", sid: str):
     c.setFont("Helvetica-Bold", 16)
     c.drawString(1.5 * cm, pg_h - 1.5 * cm, "TramaGrid")
     c.setFont("Helvetica", 9)
-    info_text = f"Dim: {session.grid_width_cells}x{session.quantized.height} pts | Data: {datetime.now().strftime('%d/%m/%Y')}"
+    info_text = f"Dim: {width}x{height} pts | Data: {datetime.now().strftime('%d/%m/%Y')}"
     if session.gauge_stitches and session.gauge_rows:
-        cm_w = round(session.grid_width_cells * 10 / session.gauge_stitches, 1)
-        cm_h = round(session.quantized.height * 10 / session.gauge_rows, 1)
+        cm_w = round(width * 10 / session.gauge_stitches, 1)
+        cm_h = round(height * 10 / session.gauge_rows, 1)
         info_text += f" | Tam: {cm_w}x{cm_h}cm"
     c.drawRightString(pg_w - 1.5 * cm, pg_h - 1.5 * cm, info_text)
 
@@ -56,6 +61,7 @@ def export_pdf(session: "TramaGridSession", sid: str):
     scale = min(avail_w / iw, avail_h / ih)
     dw, dh = iw * scale, ih * scale
     c.drawImage(ImageReader(img_buffer), (pg_w - dw) / 2, pg_h - 2.5 * cm - dh, width=dw, height=dh)
+    report(0.3)
 
     # Legenda Compacta
     c.showPage()
@@ -101,35 +107,18 @@ def export_pdf(session: "TramaGridSession", sid: str):
     c.drawString(1.5 * cm, curr_y, "Instruções Linha a Linha")
     curr_y -= 1 * cm
 
-    w, h = session.quantized.size
     available_text_width = pg_w - 3.5 * cm
 
-    for row in range(h - 1, -1, -1):
-        line = []
-        current_idx = None
-        count = 0
-
-        # ZigZag:
-        line_num = h - row
-        is_odd_line = (line_num % 2 != 0)
-
-        arrow = "←" if is_odd_line else "→"
-
-        # Se Impar: D->E (Pixel Final -> Pixel 0)
-        col_range = range(w - 1, -1, -1) if is_odd_line else range(w)
-
-        for col in col_range:
-            idx = session.quantized.getpixel((col, row))
-            sym = symbol_map.get(idx, "?")
-            if idx == current_idx:
-                count += 1
-            else:
-                if current_idx is not None:
-                    line.append(f"{count}x{sym}")
-                current_idx = idx
-                count = 1
-        if current_idx is not None:
-            line.append(f"{count}x{sym}")
+    report(0.4)
+    total_lines = session.quantized.height
+    report_every = max(1, total_lines // 20)
+
+    # OTIMIZAÇÃO: Corridas vindas do índice RLE por linha (calculado uma vez para o plano inteiro)
+    for line_num, runs in iter_lines(session):
+        if line_num % report_every == 0:
+            report(0.4 + 0.55 * line_num / total_lines)
+        arrow = line_arrow(line_num)
+        line = [f"{count}x{symbol_map.get(idx, '?')}" for idx, count in runs]
 
         full_text = f"L{line_num} [{arrow}]:  " + "  ".join(line)
 
@@ -159,4 +148,5 @@ def export_pdf(session: "TramaGridSession", sid: str):
 
     c.save()
     buffer.seek(0)
+    report(1.0)
     return buffer
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional
+from PIL import Image
+
+from .offload import heavy_pool
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Imports com fallback para execução direta
+try:
+    from ...config import EXPORT_CACHE_DIR, EXPORT_CACHE_MB
+except ImportError:
+    # Fallback quando executado fora do pacote
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    from config import EXPORT_CACHE_DIR, EXPORT_CACHE_MB
+
+# Formatos exportáveis: extensão e media type
+EXPORT_KINDS = {
+    "pdf": "application/pdf",
+    "png": "image/png",
+}
+
+# Jobs mantidos no registro (os mais antigos já concluídos saem primeiro)
+MAX_JOBS = 256
+
+# OTIMIZAÇÃO: A exportação sai da requisição. O processo web manda só o plano de índices, a
+# paleta e os parâmetros (alguns KB) para um processo do pool de trabalho pesado, que redesenha a grade e gera o
+# arquivo. O resultado fica em disco com o nome do hash desse conteúdo: exportar de novo uma
+# sessão que não mudou devolve o arquivo pronto, sem criar job no pool.
+
+# Parâmetros da sessão que o desenho da grade e a exportação leem (highlighted_row, por
+# exemplo, só muda a tela e não pode invalidar o cache)
+EXPORT_PARAMS = ("cell_size", "show_grid", "gauge_stitches", "gauge_rows")
+
+def export_state(session: "TramaGridSession") -> Dict:
+    """Tudo o que define o arquivo exportado (e nada mais)"""
+    return {
+        "size": list(session.quantized.size),
+        "data": session.quantized.tobytes(),
+        "palette": {str(k): list(v) for k, v in session.palette.items()},
+        "params": {k: getattr(session, k) for k in EXPORT_PARAMS}
+    }
+
+def content_hash(kind: str, state: Dict) -> str:
+    meta = {k: v for k, v in state.items() if k != "data"}
+    h = hashlib.sha256(kind.encode())
+    h.update(json.dumps(meta, sort_keys=True).encode())
+    h.update(state["data"])
+    return h.hexdigest()
+
+def _result_path(digest: str, kind: str) -> str:
+    return os.path.join(EXPORT_CACHE_DIR, f"{digest}.{kind}")
+
+def _progress_path(path: str) -> str:
+    return path + ".progress"
+
+def _render_export(kind: str, state: Dict, path: str) -> None:
+    """Roda no processo do pool: reconstrói a sessão, redesenha a grade e grava o arquivo"""
+    from .session import TramaGridSession
+
+    session = TramaGridSession()
+    for k, v in state["params"].items():
+        setattr(session, k, v)
+    session.palette = {int(k): tuple(v) for k, v in state["palette"].items()}
+    session.quantized = Image.frombytes("P", tuple(state["size"]), state["data"])
+    session._draw_grid()
+
+    last = [0.0]
+    def progress(fraction: float) -> None:
+        # Progresso via arquivo ao lado do resultado: o processo web só lê
+        if fraction - last[0] >= 0.05 or fraction >= 1.0:
+            last[0] = fraction
+            with open(_progress_path(path), "w") as f:
+                f.write(f"{fraction:.3f}")
+
+    buf = session.export_pdf("", progress) if kind == "pdf" else session.export_png()
+    with open(path + ".tmp", "wb") as f:
+        f.write(buf.getvalue())
+    os.replace(path + ".tmp", path)
+
+def _prune_cache() -> None:
+    """Mantém o cache de exportações dentro de EXPORT_CACHE_MB (remove os menos recentes)"""
+    files = []
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        if os.path.splitext(name)[1][1:] in EXPORT_KINDS:
+            st = os.stat(path)
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= EXPORT_CACHE_MB * 1024 * 1024:
+            break
+        os.remove(path)
+        total -= size
+
+class ExportQueue:
+    """Fila de exportações: jobs com id, progresso consultável e resultados em cache por hash"""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._running: Dict[str, str] = {}  # hash -> id do job em andamento
+        self._lock = threading.Lock()
+
+    def submit(self, session: "TramaGridSession", kind: str) -> Dict:
+        """Cria o job de exportação (ou devolve o resultado em cache / o job igual já em andamento)
+
+        Levanta Overloaded se o pool de trabalho pesado estiver sem vaga.
+        """
+        if kind not in EXPORT_KINDS:
+            raise ValueError("Formato de exportação inválido")
+        if not session.quantized:
+            raise ValueError("Grade não gerada")
+
+        state = export_state(session)
+        digest = content_hash(kind, state)
+        path = _result_path(digest, kind)
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+
+        with self._lock:
+            running = self._running.get(digest)
+            if running is not None:
+                return self.status(running)
+
+            job = {"id": str(uuid.uuid4()), "kind": kind, "hash": digest, "status": "queued",
+                   "error": None, "created": time.time()}
+            self._add(job)
+            if os.path.exists(path):
+                os.utime(path)  # Recém-usado: sai por último na limpeza
+                job["status"] = "done"
+                return self.status(job["id"])
+            self._running[digest] = job["id"]
+            job["status"] = "running"
+
+        # Fora do lock: com HEAVY_WORKERS=0 a renderização roda aqui mesmo, e status() e
+        # outros submit() não podem ficar esperando por ela
+        try:
+            future = heavy_pool.submit(_render_export, kind, state, path)
+        except Exception:
+            with self._lock:
+                self._running.pop(digest, None)
+                self._jobs.pop(job["id"], None)
+            raise
+        future.add_done_callback(lambda f, job=job: self._finish(job, f))
+        return self.status(job["id"])
+
+    def _add(self, job: Dict) -> None:
+        self._jobs[job["id"]] = job
+        while len(self._jobs) > MAX_JOBS:
+            oldest = next((j for j in self._jobs.values() if j["status"] in ("done", "error")), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest["id"]]
+
+    def _finish(self, job: Dict, future) -> None:
+        error = future.exception()
+        with self._lock:
+            self._running.pop(job["hash"], None)
+            job["status"] = "error" if error else "done"
+            job["error"] = str(error) if error else None
+        path = _result_path(job["hash"], job["kind"])
+        if os.path.exists(_progress_path(path)):
+            os.remove(_progress_path(path))
+        if not error:
+            _prune_cache()
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Estado público do job: status, progresso (0..1) e erro"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        progress = 1.0 if job["status"] == "done" else 0.0
+        if job["status"] == "running":
+            try:
+                with open(_progress_path(_result_path(job["hash"], job["kind"]))) as f:
+                    progress = float(f.read() or 0)
+            except (OSError, ValueError):
+                pass
+        return {"job_id": job["id"], "kind": job["kind"], "status": job["status"],
+                "progress": progress, "error": job["error"]}
+
+    def result(self, job_id: str):
+        """(caminho do arquivo, media type) de um job concluído, ou None"""
+        job = self._jobs.get(job_id)
+        if job is None or job["status"] != "done":
+            return None
+        path = _result_path(job["hash"], job["kind"])
+        if not os.path.exists(path):
+            return None  # Saiu do cache depois de pronto
+        return path, EXPORT_KINDS[job["kind"]]
+
+# Fila global do processo
+export_queue = ExportQueue()
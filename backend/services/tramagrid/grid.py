@@ -1,44 +1,43 @@
 import io
 import base64
 import string
-from typing import TYPE_CHECKING
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from PIL import Image, ImageDraw, ImageFont
 
+from .pipeline import run_pipeline
+from .offload import offload_pipeline
+from .rows import invalidate_rows
+from .plane import note_change
+
+# Imports com fallback para execução direta
+try:
+    from ...config import GRID_PNG_COMPRESS_LEVEL, GRID_WEBP_METHOD
+except ImportError:
+    # Fallback quando executado fora do pacote
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    from config import GRID_PNG_COMPRESS_LEVEL, GRID_WEBP_METHOD
+
 if TYPE_CHECKING:
     from .session import TramaGridSession
 
+# Margens: Espaço para números em BAIXO e na DIREITA
+PAD_TOP_LEFT = 20
+PAD_BOT_RIGHT = 60
+
 def generate_grid(session: "TramaGridSession") -> None:
     """Gera a grade a partir da imagem original"""
     if not session.original:
         return
 
-    img = session.original.copy()
-    if session.posterize < 8:
-        from PIL import ImageOps
-        img = ImageOps.posterize(img, max(1, min(8, int(session.posterize))))
-
-    if session.gamma != 1.0:
-        img = img.point([int(((i / 255.0) ** (1.0 / session.gamma)) * 255) for i in range(256)] * 3)
-
-    if session.saturation != 1.0:
-        from PIL import ImageEnhance
-        img = ImageEnhance.Color(img).enhance(session.saturation)
-
-    if session.brightness != 1.0:
-        from PIL import ImageEnhance
-        img = ImageEnhance.Brightness(img).enhance(session.brightness)
-
-    if session.contrast != 1.0:
-        from PIL import ImageEnhance
-        img = ImageEnhance.Contrast(img).enhance(session.contrast)
-
-    ratio = session.gauge_stitches / max(1, session.gauge_rows)
-    w, h = img.size
-    new_w = max(10, session.grid_width_cells)
-    new_h = int((h / w) * new_w * ratio)
-
-    session.processed = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-    session.quantized = session.processed.quantize(colors=session.max_colors, method=Image.MEDIANCUT, dither=Image.FLOYDSTEINBERG)
+    # OTIMIZAÇÃO: Estágios memorizados; só o que depende dos parâmetros alterados é refeito, e
+    # em imagens grandes esse trabalho roda no pool de processos
+    offload_pipeline(session)
+    session.processed, session.quantized = run_pipeline(session)
 
     raw = session.quantized.getpalette()[:session.max_colors * 3]
     base = {}
@@ -49,118 +48,330 @@ def generate_grid(session: "TramaGridSession") -> None:
     session.palette = {i: session.custom_palette.get(i, c) for i, c in base.items()}
     draw_grid(session)
 
-def draw_grid(session: "TramaGridSession") -> None:
-    """Desenha a grade visual com otimização de performance"""
-    if not session.quantized:
-        return
+def palette_lut(session: "TramaGridSession") -> List[int]:
+    """Monta a paleta plana (768 valores) a partir de session.palette; índices ausentes ficam brancos"""
+    flat = [255] * 768
+    for idx, (r, g, b) in session.palette.items():
+        if 0 <= idx < 256:
+            flat[idx * 3:idx * 3 + 3] = [r, g, b]
+    return flat
 
-    # Margens: Espaço para números em BAIXO e na DIREITA
-    pad_top_left = 20
-    pad_bot_right = 60
+def quantized_to_rgb(session: "TramaGridSession", box=None) -> Image.Image:
+    """Converte a imagem indexada (ou um recorte dela) para RGB usando session.palette em um único passo"""
+    img = session.quantized.copy() if box is None else session.quantized.crop(box)
+    img.putpalette(palette_lut(session))
+    return img.convert("RGB")
 
-    wc, hc = session.quantized.size
-    total_w = pad_top_left + wc * session.cell_size + pad_bot_right
-    total_h = pad_top_left + hc * session.cell_size + pad_bot_right
-
-    if not session.show_grid:
-        base = Image.new("RGBA", (total_w, total_h), (255, 255, 255, 255))
-        # OTIMIZAÇÃO: Usa resize com NEAREST para criar imagem ampliada de uma vez
-        prev = session.quantized.resize((wc * session.cell_size, hc * session.cell_size), Image.Resampling.NEAREST)
-        base.paste(prev, (pad_top_left, pad_top_left))
-        session.grid_image = base.convert("RGB")
-        return
+class GridLayers:
+    """Camadas estáticas da numeração: dependem só de (wc, hc, cell_size), nunca das cores"""
 
-    # OTIMIZAÇÃO: Cria a imagem base ampliada de uma só vez em vez de loop aninhado
-    # Primeiro, cria uma imagem RGB temporária com as cores da paleta
-    temp_rgb = Image.new("RGB", (wc, hc))
-    temp_draw = ImageDraw.Draw(temp_rgb)
+    def __init__(self, bottom: Image.Image, right: Image.Image):
+        self.bottom = bottom  # Faixa inferior com a numeração do eixo X
+        self.right = right    # Faixa direita com a numeração do eixo Y
+        self.nbytes = 3 * (bottom.width * bottom.height + right.width * right.height)
 
-    # Converte imagem indexada para RGB usando a paleta
-    for y in range(hc):
-        for x in range(wc):
-            color_idx = session.quantized.getpixel((x, y))
-            color = session.palette.get(color_idx, (255, 255, 255))
-            temp_draw.point((x, y), color)
-
-    # Agora amplia a imagem de uma só vez com NEAREST (muito mais rápido)
-    base = Image.new("RGBA", (total_w, total_h), (255, 255, 255, 255))
-    upscaled = temp_rgb.resize((wc * session.cell_size, hc * session.cell_size), Image.Resampling.NEAREST)
-    base.paste(upscaled, (pad_top_left, pad_top_left))
-
-    overlay = Image.new("RGBA", (total_w, total_h), (255, 255, 255, 0))
-    d_ov = ImageDraw.Draw(overlay)
-
-    # Linhas de Grade
-    for y in range(hc + 1):
-        py = pad_top_left + y * session.cell_size
-        thk = (y % 10 == 0 or y == 0 or y == hc)
-        d_ov.line([(pad_top_left, py), (pad_top_left + wc * session.cell_size, py)],
-                  fill=(255, 255, 255, 180 if thk else 70), width=2 if thk else 1)
-    for x in range(wc + 1):
-        px = pad_top_left + x * session.cell_size
-        thk = (x % 10 == 0 or x == 0 or x == wc)
-        d_ov.line([(px, pad_top_left), (px, pad_top_left + hc * session.cell_size)],
-                  fill=(255, 255, 255, 180 if thk else 70), width=2 if thk else 1)
-
-    combined = Image.alpha_composite(base, overlay)
-    d_comb = ImageDraw.Draw(combined)
+# Acima disso, os retângulos sujos são fundidos em um só antes de repintar
+MAX_DIRTY_RECTS = 64
 
-    # Números da grade (padrão crochê/tapestry)
+# OTIMIZAÇÃO: Cache de camadas compartilhado entre sessões, com despejo LRU por orçamento de bytes
+# (as faixas das linhas de grade ficam no lru_cache de line_spans)
+LAYER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_layer_cache: "OrderedDict[Tuple[int, int, int], GridLayers]" = OrderedDict()
+_layer_cache_bytes = 0
+_layer_cache_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _load_font():
+    """Carrega a fonte dos números uma única vez por processo"""
     try:
-        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 14)
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", 14)
     except:
         try:
-            font = ImageFont.truetype("liberation-sans-bold.ttf", 14)
+            return ImageFont.truetype("liberation-sans-bold.ttf", 14)
         except:
-            font = ImageFont.load_default()
+            return ImageFont.load_default()
 
+@lru_cache(maxsize=64)
+def line_spans(count: int, cell_size: int) -> Tuple[Tuple[int, int, int], ...]:
+    """Faixas (início, fim, alpha) das linhas de grade: grossas (2px, a cada 10) e finas (1px)"""
+    limit = count * cell_size
+    spans = []
+    for i in range(count + 1):
+        p = i * cell_size
+        thk = (i % 10 == 0 or i == 0 or i == count)
+        end = min(limit, p + (2 if thk else 1))
+        if p < end:
+            spans.append((p, end, 180 if thk else 70))
+    return tuple(spans)
+
+def _build_layers(wc: int, hc: int, cell_size: int) -> GridLayers:
+    """Desenha a numeração dos eixos para uma geometria"""
+    grid_w, grid_h = wc * cell_size, hc * cell_size
+    total_w = PAD_TOP_LEFT + grid_w + PAD_BOT_RIGHT
+
+    # Números da grade (padrão crochê/tapestry)
+    font = _load_font()
     text_color = (100, 100, 100)
 
     # EIXO X (embaixo da grade): Direita → Esquerda (1 na direita, max na esquerda)
-    y_pos_x = pad_top_left + hc * session.cell_size + 5
+    bottom = Image.new("RGB", (total_w, PAD_BOT_RIGHT), (255, 255, 255))
+    d_bt = ImageDraw.Draw(bottom)
     for x in range(wc):
         num = wc - x  # inverte: x=0 vira wc, x=wc-1 vira 1
         txt = str(num)
-        bbox = draw.textbbox((0, 0), txt, font=font)
+        bbox = d_bt.textbbox((0, 0), txt, font=font)
         tw = bbox[2] - bbox[0]
-        tx = pad_top_left + x * session.cell_size + (session.cell_size - tw) / 2
-        d_comb.text((tx, y_pos_x), txt, fill=text_color, font=font)
+        tx = PAD_TOP_LEFT + x * cell_size + (cell_size - tw) / 2
+        d_bt.text((tx, 5), txt, fill=text_color, font=font)
 
     # EIXO Y (lado DIREITO da grade): Baixo → Cima (1 embaixo, max em cima)
-    x_pos_y = pad_top_left + wc * session.cell_size + 5  # 5px à direita da grade
+    right = Image.new("RGB", (PAD_BOT_RIGHT, PAD_TOP_LEFT + grid_h), (255, 255, 255))
+    d_rt = ImageDraw.Draw(right)
     for y in range(hc):
         num = hc - y  # inverte: y=0 vira hc, y=hc-1 vira 1
         txt = str(num)
-        bbox = draw.textbbox((0, 0), txt, font=font)
+        bbox = d_rt.textbbox((0, 0), txt, font=font)
         th = bbox[3] - bbox[1]
-        ty = pad_top_left + y * session.cell_size + (session.cell_size - th) / 2
-        d_comb.text((x_pos_y, ty), txt, fill=text_color, font=font)
+        ty = PAD_TOP_LEFT + y * cell_size + (cell_size - th) / 2
+        d_rt.text((5, ty), txt, fill=text_color, font=font)  # 5px à direita da grade
 
-    session.grid_image = combined.convert("RGB")
+    return GridLayers(bottom, right)
 
-def get_grid_base64(session: "TramaGridSession") -> str:
-    """Retorna a grade como base64"""
-    if not session.grid_image:
-        return ""
+def get_grid_layers(wc: int, hc: int, cell_size: int) -> GridLayers:
+    """Retorna as camadas estáticas da geometria, construindo e guardando no cache se necessário"""
+    global _layer_cache_bytes
+    key = (wc, hc, cell_size)
+    with _layer_cache_lock:
+        layers = _layer_cache.get(key)
+        if layers is not None:
+            _layer_cache.move_to_end(key)
+            return layers
+
+    layers = _build_layers(wc, hc, cell_size)
+
+    with _layer_cache_lock:
+        if key not in _layer_cache and layers.nbytes <= LAYER_CACHE_MAX_BYTES:
+            _layer_cache[key] = layers
+            _layer_cache_bytes += layers.nbytes
+            while _layer_cache_bytes > LAYER_CACHE_MAX_BYTES:
+                _, old = _layer_cache.popitem(last=False)
+                _layer_cache_bytes -= old.nbytes
+    return layers
+
+def _blend_white(img: Image.Image, alpha: int, box=None) -> None:
+    """Mistura branco sobre a imagem (ou uma faixa dela) na opacidade dada, in-place"""
+    box = box or (0, 0) + img.size
+    img.paste((255, 255, 255), box, Image.new("L", (box[2] - box[0], box[3] - box[1]), alpha))
+
+def render_cells(session: "TramaGridSession", box=None, cell_size: Optional[int] = None,
+                 lines: Optional[bool] = None) -> Image.Image:
+    """Renderiza a camada de cores ampliada (com as linhas, se show_grid) de um retângulo de células
+
+    `cell_size` e `lines` permitem renderizar em outra escala (ex.: tiles), sem afetar a sessão.
+
+    As linhas verticais são aplicadas antes da ampliação vertical, quando a imagem ainda tem
+    uma linha de pixels por carreira; as horizontais são coladas prontas depois. No cruzamento
+    prevalece a linha vertical, como no overlay original.
+    """
+    wc, hc = session.quantized.size
+    cs = cell_size or session.cell_size
+    x0, y0, x1, y1 = box or (0, 0, wc, hc)
+    w, h = (x1 - x0) * cs, (y1 - y0) * cs
+
+    # OTIMIZAÇÃO: Converte a imagem indexada para RGB aplicando a paleta de uma só vez (em C)
+    small = quantized_to_rgb(session, box)
+    if not (session.show_grid if lines is None else lines):
+        return small.resize((w, h), Image.Resampling.NEAREST)
+
+    ox, oy = x0 * cs, y0 * cs
+
+    # Ampliada só na horizontal: uma linha de pixels por carreira
+    rows = small.resize((w, y1 - y0), Image.Resampling.NEAREST)
+    lined = rows.copy()
+    col_mask = Image.new("L", (w, 1), 0)
+    for lx0, lx1, alpha in line_spans(wc, cs):
+        lx0, lx1 = max(lx0 - ox, 0), min(lx1 - ox, w)
+        if lx0 < lx1:
+            _blend_white(lined, alpha, (lx0, 0, lx1, lined.height))
+            col_mask.paste(255, (lx0, 0, lx1, 1))
 
-    img = session.grid_image.copy()
-    if session.highlighted_row >= 0:
-        # Cria o overlay totalmente transparente (0 alpha)
-        ov = Image.new("RGBA", img.size, (0, 0, 0, 0))
-        d = ImageDraw.Draw(ov)
+    cells = lined.resize((w, h), Image.Resampling.NEAREST)
 
-        row_idx = session.quantized.height - session.highlighted_row
-        if 0 <= row_idx < session.quantized.height:
-            # pad_top_left é 20 no código
-            py = 20 + row_idx * session.cell_size
+    # Carreiras prontas para as linhas horizontais, por opacidade (verticais preservadas)
+    col_mask = col_mask.resize(rows.size, Image.Resampling.NEAREST)
+    hrows = {}
+    for ly0, ly1, alpha in line_spans(hc, cs):
+        for py in range(max(ly0 - oy, 0), min(ly1 - oy, h)):
+            if alpha not in hrows:
+                blended = rows.copy()
+                _blend_white(blended, alpha)
+                hrows[alpha] = Image.composite(lined, blended, col_mask)
+            r = py // cs
+            cells.paste(hrows[alpha].crop((0, r, w, r + 1)), (0, py))
+    return cells
 
-            # Pinta o "escuro" APENAS acima e abaixo da linha,
-            # deixando a linha com 0 alpha (cor original/branca)
-            d.rectangle([0, 0, img.width, py], fill=(0, 0, 0, 180))
-            d.rectangle([0, py + session.cell_size, img.width, img.height], fill=(0, 0, 0, 180))
+def draw_grid(session: "TramaGridSession") -> None:
+    """Desenha a grade visual com otimização de performance"""
+    if not session.quantized:
+        return
+    if session._render_deferred:
+        # Renderização adiada (ex.: replay do diário): o próximo refresh redesenha tudo
+        session._grid_state = None
+        session.tiles.clear()
+        return
+
+    wc, hc = session.quantized.size
+    grid_w, grid_h = wc * session.cell_size, hc * session.cell_size
+    total_w = PAD_TOP_LEFT + grid_w + PAD_BOT_RIGHT
+    total_h = PAD_TOP_LEFT + grid_h + PAD_BOT_RIGHT
+
+    base = Image.new("RGB", (total_w, total_h), (255, 255, 255))
+    base.paste(render_cells(session), (PAD_TOP_LEFT, PAD_TOP_LEFT))
+
+    if session.show_grid:
+        # OTIMIZAÇÃO: Números vêm prontos do cache de camadas; só a camada de cores é recomposta
+        layers = get_grid_layers(wc, hc, session.cell_size)
+        base.paste(layers.bottom, (0, PAD_TOP_LEFT + grid_h))
+        base.paste(layers.right, (PAD_TOP_LEFT + grid_w, 0))
+
+    session.grid_image = base
+    session.grid_version += 1
+    session._grid_state = _grid_state(session)
+    session._dirty_rects = []
+    session.tiles.clear()
+
+def _grid_state(session: "TramaGridSession"):
+    """Tudo o que, se mudar, obriga a redesenhar a grade inteira"""
+    return (session.quantized.size, session.cell_size, session.show_grid, dict(session.palette))
+
+def mark_dirty(session: "TramaGridSession", x0: int, y0: int, x1: int, y1: int) -> None:
+    """Registra um retângulo de células (x1/y1 exclusivos) alterado desde a última renderização"""
+    if not session.quantized:
+        return
+    wc, hc = session.quantized.size
+    x0, y0, x1, y1 = max(0, x0), max(0, y0), min(wc, x1), min(hc, y1)
+    if x0 < x1 and y0 < y1:
+        session._dirty_rects.append((x0, y0, x1, y1))
+        session.tiles.invalidate((x0, y0, x1, y1))
+        invalidate_rows(session, y0, y1)
+        note_change(session, (x0, y0, x1, y1))
+
+def refresh_grid(session: "TramaGridSession") -> None:
+    """Atualiza a grade: repinta só os retângulos sujos, ou tudo se geometria/paleta mudaram"""
+    if not session.quantized or session._render_deferred:
+        return
+    if session.grid_image is None or session._grid_state != _grid_state(session):
+        draw_grid(session)
+        return
 
-        img = Image.alpha_composite(img.convert("RGBA"), ov).convert("RGB")
+    rects = session._dirty_rects
+    session._dirty_rects = []
+    if len(rects) > MAX_DIRTY_RECTS:
+        # Muitos retângulos pequenos: um único recorte envolvente sai mais barato
+        rects = [(min(r[0] for r in rects), min(r[1] for r in rects),
+                  max(r[2] for r in rects), max(r[3] for r in rects))]
 
+    # OTIMIZAÇÃO: Renderiza só as células afetadas (com as linhas) e cola no lugar,
+    # mantendo a cópia escurecida em dia pelo mesmo caminho
+    cs = session.cell_size
+    dimmed = session._dimmed_image if session._dimmed_version == session.grid_version else None
+    for box in rects:
+        cells = render_cells(session, box)
+        pos = (PAD_TOP_LEFT + box[0] * cs, PAD_TOP_LEFT + box[1] * cs)
+        session.grid_image.paste(cells, pos)
+        if dimmed is not None:
+            dimmed.paste(cells.point(_dim_lut()), pos)
+    if rects:
+        session.grid_version += 1
+        if dimmed is not None:
+            session._dimmed_version = session.grid_version
+
+@lru_cache(maxsize=1)
+def _dim_lut() -> List[int]:
+    """Tabela que escurece cada canal como um véu preto de alpha 180 (mesmo arredondamento do alpha_composite)"""
+    ramp = Image.frombytes("L", (256, 1), bytes(range(256))).convert("RGBA")
+    veil = Image.new("RGBA", ramp.size, (0, 0, 0, 180))
+    return list(Image.alpha_composite(ramp, veil).convert("L").getdata()) * 3
+
+def dimmed_grid(session: "TramaGridSession") -> Image.Image:
+    """Cópia escurecida da grade, refeita só quando a grade muda (grid_version)"""
+    if session._dimmed_image is None or session._dimmed_version != session.grid_version:
+        session._dimmed_image = session.grid_image.point(_dim_lut())
+        session._dimmed_version = session.grid_version
+    return session._dimmed_image
+
+def highlight_box(session: "TramaGridSession"):
+    """Faixa (em pixels) que fica sem escurecer para a carreira destacada, ou None"""
+    if session.highlighted_row < 0 or not session.quantized:
+        return None
+    row_idx = session.quantized.height - session.highlighted_row
+    if not 0 <= row_idx < session.quantized.height:
+        return None
+    py = PAD_TOP_LEFT + row_idx * session.cell_size
+    # O escuro cobre até a linha py (inclusive) e recomeça em py + cell_size
+    return (0, py + 1, session.grid_image.width, py + session.cell_size)
+
+# Formatos da grade em binário: media type, faixa do nível e nível padrão
+GRID_FORMATS = {
+    "png": ("image/png", range(0, 10), GRID_PNG_COMPRESS_LEVEL),
+    "webp": ("image/webp", range(0, 7), GRID_WEBP_METHOD),
+}
+
+def _resolve_format(fmt: str, level: Optional[int]) -> int:
+    if fmt not in GRID_FORMATS:
+        raise ValueError("Formato de imagem inválido")
+    _, levels, default = GRID_FORMATS[fmt]
+    if level is None:
+        return default
+    if level not in levels:
+        raise ValueError(f"Nível de compressão deve estar entre {levels.start} e {levels.stop - 1}")
+    return level
+
+def grid_etag(session: "TramaGridSession", fmt: str = "png", level: Optional[int] = None) -> str:
+    """ETag forte da grade como seria codificada agora (sem codificar nada)
+
+    Identifica a instância da sessão, a versão da renderização, a carreira destacada e o
+    codificador; qualquer mudança em um deles muda os bytes e, portanto, a ETag.
+    """
+    level = _resolve_format(fmt, level)
+    row = session.highlighted_row if highlight_box(session) is not None else -1
+    return f'"{session._render_id}-{session.grid_version}-{row}-{fmt}{level}"'
+
+def encode_grid(session: "TramaGridSession", fmt: str = "png", level: Optional[int] = None) -> Tuple[str, bytes]:
+    """Grade codificada em PNG ou WebP sem perdas, com a ETag correspondente
+
+    OTIMIZAÇÃO: O último resultado fica guardado pela ETag; enquanto a grade não muda, pedir
+    de novo não codifica nada.
+    """
+    etag = grid_etag(session, fmt, level)
+    if not session.grid_image:
+        return etag, b""
+    cached = session._encoded_grid
+    if cached is not None and cached[0] == etag:
+        return cached
+
+    level = _resolve_format(fmt, level)
+    options = {"compress_level": level} if fmt == "png" else {"lossless": True, "method": level}
+    img = session.grid_image
+    box = highlight_box(session)
     buf = io.BytesIO()
-    img.save(buf, "PNG")
-    return base64.b64encode(buf.getvalue()).decode()
+    if box is None:
+        img.save(buf, fmt.upper(), **options)
+    else:
+        # OTIMIZAÇÃO: Usa a cópia pré-escurecida e cola só a faixa da carreira destacada,
+        # restaurando a faixa escura depois (nenhuma imagem do tamanho da grade é alocada)
+        dimmed = dimmed_grid(session)
+        dark_strip = dimmed.crop(box)
+        dimmed.paste(img.crop(box), box)
+        try:
+            dimmed.save(buf, fmt.upper(), **options)
+        finally:
+            dimmed.paste(dark_strip, box)
+    session._encoded_grid = (etag, buf.getvalue())
+    return session._encoded_grid
+
+def get_grid_base64(session: "TramaGridSession") -> str:
+    """Retorna a grade como base64"""
+    if not session.grid_image:
+        return ""
+    return base64.b64encode(encode_grid(session, "png")[1]).decode()
@@ -1,50 +1,206 @@
-from typing import TYPE_CHECKING
+import zlib
+import base64
+from typing import TYPE_CHECKING, Dict, Optional
+from PIL import Image, ImageChops
 
 if TYPE_CHECKING:
     from .session import TramaGridSession
 
-def undo(session: "TramaGridSession"):
-    """Desfaz a última operação com reconstrução otimizada de imagem"""
-    if not session.history:
-        return
+# Orçamento de memória do histórico (desfazer + refazer) por sessão, em bytes
+HISTORY_MAX_BYTES = 8 * 1024 * 1024
+
+# Custo fixo estimado de uma entrada (dict, tuplas) e de cada cor de paleta guardada
+_ENTRY_OVERHEAD = 256
+_PALETTE_COLOR_BYTES = 96
+
+# OTIMIZAÇÃO DE MEMÓRIA: cada entrada guarda só o retângulo que mudou (comprimido) e a paleta
+# apenas se ela mudou. A entrada é reversível por si só: aplicar uma devolve a entrada inversa,
+# então não há cadeia para reconstruir. Mudança de tamanho da grade vira um quadro completo.
 
-    # Salva o estado atual no REDO antes de voltar
-    current_state = {
+def _snapshot(session: "TramaGridSession") -> Dict:
+    """Estado atual completo (pendente até a próxima edição ser conhecida)"""
+    return {
         'quantized_data': session.quantized.tobytes(),
         'quantized_size': session.quantized.size,
         'quantized_mode': session.quantized.mode,
         'palette': session.palette.copy(),
         'custom_palette': session.custom_palette.copy()
     }
-    session.redo_history.append(current_state)
-
-    last_state = session.history.pop()
-    # Reconstrói a imagem a partir dos dados binários
-    from PIL import Image
-    session.quantized = Image.frombytes(last_state['quantized_mode'], last_state['quantized_size'], last_state['quantized_data'])
-    session.palette = last_state['palette']
-    session.custom_palette = last_state['custom_palette']
-    session._draw_grid()
-
-def redo(session: "TramaGridSession"):
-    """Refaz a última operação desfeita com reconstrução otimizada de imagem"""
-    if not session.redo_history:
+
+def _entry_nbytes(entry: Dict) -> int:
+    colors = len(entry['palette'] or ()) + len(entry['custom_palette'] or ())
+    return _ENTRY_OVERHEAD + len(entry['data']) + colors * _PALETTE_COLOR_BYTES
+
+def _make_entry(size, mode, bbox, data: bytes, palette: Optional[Dict], custom_palette: Optional[Dict]) -> Dict:
+    entry = {
+        'size': size,
+        'mode': mode,
+        'bbox': bbox,  # None = nenhum pixel mudou
+        'data': zlib.compress(data, 1) if bbox else b'',
+        'palette': palette,  # None = paleta inalterada
+        'custom_palette': custom_palette
+    }
+    entry['nbytes'] = _entry_nbytes(entry)
+    return entry
+
+def _entry_from_snapshot(session: "TramaGridSession", before: Dict) -> Dict:
+    """Entrada que leva o estado atual de volta ao `before`"""
+    size, mode = before['quantized_size'], before['quantized_mode']
+    if session.quantized and session.quantized.size == size:
+        old = Image.frombytes("L", size, before['quantized_data'])
+        cur = Image.frombytes("L", size, session.quantized.tobytes())
+        bbox = ImageChops.difference(old, cur).getbbox()
+        data = old.crop(bbox).tobytes() if bbox else b''
+    else:
+        # Quadro completo: a grade foi regerada com outro tamanho
+        bbox, data = (0, 0) + size, before['quantized_data']
+
+    palette_changed = before['palette'] != session.palette or before['custom_palette'] != session.custom_palette
+    return _make_entry(size, mode, bbox, data,
+                       before['palette'] if palette_changed else None,
+                       before['custom_palette'] if palette_changed else None)
+
+def _apply_entry(session: "TramaGridSession", entry: Dict) -> Dict:
+    """Aplica a entrada na sessão e devolve a entrada inversa (para refazer/desfazer)"""
+    size, bbox = entry['size'], entry['bbox']
+    same_size = session.quantized is not None and session.quantized.size == size
+
+    # Inversa: o mesmo retângulo (ou o quadro inteiro) e a paleta como estão agora
+    if same_size:
+        inv_bbox = bbox
+        inv_data = session.quantized.crop(bbox).tobytes() if bbox else b''
+    else:
+        inv_bbox = (0, 0) + session.quantized.size
+        inv_data = session.quantized.tobytes()
+    has_palette = entry['palette'] is not None
+    inverse = _make_entry(session.quantized.size, session.quantized.mode, inv_bbox, inv_data,
+                          session.palette.copy() if has_palette else None,
+                          session.custom_palette.copy() if has_palette else None)
+
+    if bbox:
+        data = zlib.decompress(entry['data'])
+        if same_size:
+            patch = Image.frombytes(entry['mode'], (bbox[2] - bbox[0], bbox[3] - bbox[1]), data)
+            session.quantized.paste(patch, bbox[:2])
+        else:
+            session.quantized = Image.frombytes(entry['mode'], size, data)
+    if has_palette:
+        session.palette = entry['palette'].copy()
+        session.custom_palette = entry['custom_palette'].copy()
+
+    # OTIMIZAÇÃO: Repinta só o retângulo restaurado (refresh_grid redesenha tudo se a paleta/tamanho mudou)
+    if bbox and same_size:
+        session._mark_dirty(*bbox)
+    session._refresh_grid()
+    return inverse
+
+def _push(session: "TramaGridSession", stack, entry: Dict) -> None:
+    stack.append(entry)
+    session.history_bytes += entry['nbytes']
+    _enforce_budget(session)
+
+def _pop(session: "TramaGridSession", stack) -> Dict:
+    entry = stack.pop()
+    session.history_bytes -= entry['nbytes']
+    return entry
+
+def _enforce_budget(session: "TramaGridSession") -> None:
+    """Descarta as entradas mais antigas (desfazer primeiro, depois refazer) até caber no orçamento"""
+    for stack in (session.history, session.redo_history):
+        while session.history_bytes > HISTORY_MAX_BYTES and len(stack) > 1:
+            session.history_bytes -= stack.pop(0)['nbytes']
+
+def _flush_pending(session: "TramaGridSession") -> None:
+    """Converte o estado pendente em uma entrada de desfazer, agora que a edição já foi aplicada"""
+    pending = session._pending_state
+    if pending is None:
         return
+    session._pending_state = None
+    if session.quantized:
+        _push(session, session.history, _entry_from_snapshot(session, pending))
 
-    state = session.redo_history.pop()
-    # Antes de aplicar o redo, salva onde estamos no undo
-    current_state = {
-        'quantized_data': session.quantized.tobytes(),
-        'quantized_size': session.quantized.size,
-        'quantized_mode': session.quantized.mode,
-        'palette': session.palette.copy(),
-        'custom_palette': session.custom_palette.copy()
+def save_state(session: "TramaGridSession") -> None:
+    """Salva o estado atual antes de uma modificação com otimização de memória"""
+    if not session.quantized or session._in_transaction:
+        return  # Em um lote o estado já foi salvo uma vez, no início (ver transaction.py)
+
+    _flush_pending(session)
+    # Guarda só uma cópia completa (a pendente); o diff é calculado depois da edição
+    session._pending_state = _snapshot(session)
+    if session.redo_history:
+        session.history_bytes -= sum(e['nbytes'] for e in session.redo_history)
+        session.redo_history = []  # Limpa o refazer ao fazer nova ação
+
+def clear_history(session: "TramaGridSession") -> None:
+    """Descarta todo o histórico de desfazer/refazer"""
+    session.history = []
+    session.redo_history = []
+    session.history_bytes = 0
+    session._pending_state = None
+
+def undo(session: "TramaGridSession") -> Optional[Dict]:
+    """Desfaz a última operação aplicando a entrada diferencial (devolve a entrada aplicada)"""
+    _flush_pending(session)
+    if not session.history or not session.quantized:
+        return None
+
+    entry = _pop(session, session.history)
+    _push(session, session.redo_history, _apply_entry(session, entry))
+    return entry
+
+def redo(session: "TramaGridSession") -> Optional[Dict]:
+    """Refaz a última operação desfeita aplicando a entrada diferencial (devolve a entrada aplicada)"""
+    _flush_pending(session)
+    if not session.redo_history or not session.quantized:
+        return None
+
+    entry = _pop(session, session.redo_history)
+    _push(session, session.history, _apply_entry(session, entry))
+    return entry
+
+def _palette_to_json(palette: Optional[Dict]) -> Optional[Dict]:
+    return {str(k): list(v) for k, v in palette.items()} if palette is not None else None
+
+def _palette_from_json(palette: Optional[Dict]) -> Optional[Dict]:
+    return {int(k): tuple(v) for k, v in palette.items()} if palette is not None else None
+
+def entry_to_record(entry: Dict) -> Dict:
+    """Entrada de histórico em JSON (para o diário): o desfazer em memória não vai para o disco,
+    então o diário guarda o que foi aplicado, não só o nome da operação"""
+    return {
+        'size': list(entry['size']),
+        'mode': entry['mode'],
+        'bbox': list(entry['bbox']) if entry['bbox'] else None,
+        'data': base64.b64encode(entry['data']).decode(),
+        'palette': _palette_to_json(entry['palette']),
+        'custom_palette': _palette_to_json(entry['custom_palette'])
+    }
+
+def entry_from_record(rec: Dict) -> Dict:
+    bbox = tuple(rec['bbox']) if rec['bbox'] else None
+    entry = {
+        'size': tuple(rec['size']),
+        'mode': rec['mode'],
+        'bbox': bbox,
+        'data': base64.b64decode(rec['data']),
+        'palette': _palette_from_json(rec['palette']),
+        'custom_palette': _palette_from_json(rec['custom_palette'])
     }
-    session.history.append(current_state)
-
-    # Reconstrói a imagem a partir dos dados binários
-    from PIL import Image
-    session.quantized = Image.frombytes(state['quantized_mode'], state['quantized_size'], state['quantized_data'])
-    session.palette = state['palette']
-    session.custom_palette = state['custom_palette']
-    session._draw_grid()
+    entry['nbytes'] = _entry_nbytes(entry)
+    return entry
+
+def restore(session: "TramaGridSession", direction: str, rec: Dict) -> None:
+    """Reaplica um desfazer/refazer gravado no diário
+
+    Se a entrada correspondente está na pilha (a operação desfeita também veio do diário), ela
+    sai da pilha como no desfazer original; se é anterior ao snapshot, só o estado é aplicado.
+    Em ambos os casos a inversa vai para a outra pilha.
+    """
+    if direction not in ("undo", "redo") or not session.quantized:
+        return
+    _flush_pending(session)
+    source, target = ((session.history, session.redo_history) if direction == "undo"
+                      else (session.redo_history, session.history))
+    if source:
+        _pop(session, source)
+    _push(session, target, _apply_entry(session, entry_from_record(rec)))
@@ -1,14 +1,53 @@
 import io
-from typing import TYPE_CHECKING, List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+from PIL import Image, ImageChops, ImageOps
+
+from .rows import line_runs
 
 if TYPE_CHECKING:
     from .session import TramaGridSession
 
+# Imports com fallback para execução direta
+try:
+    from ...config import MAX_UPLOAD_PIXELS, WORKING_COPY_MAX_SIDE
+except ImportError:
+    # Fallback quando executado fora do pacote
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    from config import MAX_UPLOAD_PIXELS, WORKING_COPY_MAX_SIDE
+
+def open_working_copy(file_bytes, max_side: int = WORKING_COPY_MAX_SIDE):
+    """Decodifica a imagem enviada direto na resolução de trabalho (RGB, maior lado <= max_side)
+
+    OTIMIZAÇÃO: O tamanho é checado pelo cabeçalho, antes de decodificar (bombas de descompressão
+    são recusadas sem alocar nada). JPEG é decodificado já reduzido (draft, escala 1/2..1/8);
+    o resto é reduzido com LANCZOS e a orientação EXIF é aplicada na cópia já pequena.
+    """
+    try:
+        img = Image.open(io.BytesIO(file_bytes))
+    except Image.DecompressionBombError:
+        raise ValueError("Imagem muito grande")
+    if img.width * img.height > MAX_UPLOAD_PIXELS:
+        raise ValueError("Imagem muito grande")
+
+    # Caixa quadrada: o mesmo limite vale para qualquer orientação EXIF
+    ratio = max_side / max(img.size)
+    if ratio < 1:
+        img.draft("RGB", (max(1, int(img.width * ratio)), max(1, int(img.height * ratio))))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    # Gira/espelha só a cópia já reduzida
+    img = ImageOps.exif_transpose(img)
+    return img
+
 def load_image(session: "TramaGridSession", file_bytes: bytes) -> None:
-    """Carrega uma imagem na sessão"""
-    from PIL import Image
-    session.original = Image.open(io.BytesIO(file_bytes)).convert("RGB")
-    session.history = []
+    """Carrega uma imagem na sessão (a cópia de trabalho fica na memória, o arquivo original só no disco)"""
+    session.original = open_working_copy(file_bytes)
+    # Arquivo enviado, na resolução total: gravado no próximo snapshot e lido de lá sob demanda
+    session._original_blob = file_bytes
+    session.clear_history()
 
 def paint_cell(session: "TramaGridSession", x, y, idx):
     """Pinta uma célula específica"""
@@ -18,7 +57,9 @@ def paint_cell(session: "TramaGridSession", x, y, idx):
     session._save_state()
     if 0 <= x < session.quantized.width and 0 <= y < session.quantized.height:
         session.quantized.putpixel((x, y), idx)
-        session._draw_grid()
+        # OTIMIZAÇÃO: Repinta só a célula alterada
+        session._mark_dirty(x, y, x + 1, y + 1)
+        session._refresh_grid()
 
 def get_pixel_index(session: "TramaGridSession", x, y):
     """Retorna o índice da cor de um pixel"""
@@ -26,46 +67,139 @@ def get_pixel_index(session: "TramaGridSession", x, y):
 
 def replace_index_in_region(session: "TramaGridSession", x, y, w, h, f, t):
     """Substitui um índice por outro em uma região"""
+    remap_region(session, x, y, w, h, {f: t})
+
+def remap_region(session: "TramaGridSession", x, y, w, h, table: Dict, invert: bool = False):
+    """Troca índices por uma tabela {de: para} dentro do retângulo (ou fora dele, com invert=True)
+
+    OTIMIZAÇÃO: A troca é um point() com LUT de 256 entradas sobre o recorte do plano de
+    índices, colado de volta de uma vez: custo de cópia de memória, não de laço em Python.
+    Só o retângulo que realmente mudou é repintado.
+    """
     if not session.quantized:
         return
 
+    # Valida a tabela inteira antes de mexer em qualquer coisa
+    if not isinstance(table, dict):
+        raise ValueError("Tabela de troca inválida")
+    lut = list(range(256))
+    for f, t in table.items():
+        try:
+            f, t = int(f), int(t)
+        except (TypeError, ValueError):
+            raise ValueError("Tabela de troca inválida")
+        if not (0 <= f <= 255 and 0 <= t <= 255):
+            raise ValueError("Índices da tabela devem estar entre 0 e 255")
+        if t != f and t not in session.palette:
+            raise ValueError(f"Cor {t} não está na paleta")
+        lut[f] = t
+
+    session._save_state()
+
+    q = session.quantized
+    box = (max(0, x), max(0, y), min(q.width, x + w), min(q.height, y + h))
+    has_box = box[0] < box[2] and box[1] < box[3]
+    if invert:
+        # Fora da seleção: remapeia o plano inteiro e devolve o recorte original
+        before = q
+        after = q.point(lut)
+        if has_box:
+            after.paste(q.crop(box), box[:2])
+        offset = (0, 0)
+    elif has_box:
+        before = q.crop(box)
+        after = before.point(lut)
+        offset = box[:2]
+    else:
+        return
+
+    # Índices comparados como bytes (convert("L") passaria pela paleta)
+    changed = ImageChops.difference(Image.frombytes("L", before.size, before.tobytes()),
+                                    Image.frombytes("L", after.size, after.tobytes())).getbbox()
+    if changed:
+        q.paste(after.crop(changed), (offset[0] + changed[0], offset[1] + changed[1]))
+        session._mark_dirty(offset[0] + changed[0], offset[1] + changed[1],
+                            offset[0] + changed[2], offset[1] + changed[3])
+    session._refresh_grid()
+
+def flood_fill(session: "TramaGridSession", x, y, idx, connectivity: int = 4) -> Optional[Tuple[int, int, int, int]]:
+    """Balde de tinta: pinta a região contígua da cor de (x, y) e devolve a caixa pintada (x1/y1 exclusivos)
+
+    OTIMIZAÇÃO: Preenchimento por scanline direto no plano de índices. Uma máscara de bytes
+    (1 = cor alvo ainda não pintada) deixa achar os limites de cada faixa e as faixas das linhas
+    vizinhas com find/rfind (em C), sem getpixel/putpixel por célula.
+    """
+    if connectivity not in (4, 8):
+        raise ValueError("Conectividade deve ser 4 ou 8")
+    if not session.quantized or idx not in session.palette:
+        return None
+    w, h = session.quantized.size
+    if not (0 <= x < w and 0 <= y < h):
+        return None
+
+    plane = bytearray(session.quantized.tobytes())
+    target = plane[y * w + x]
+    if target == idx:
+        return None
+
+    table = bytearray(256)
+    table[target] = 1
+    mask = plane.translate(table)
+    fill = bytes([idx])
+    reach = 1 if connectivity == 8 else 0
+    x0, y0, x1, y1 = x, y, x + 1, y + 1
+
+    stack = [(x, y)]
+    while stack:
+        sx, sy = stack.pop()
+        row = sy * w
+        if not mask[row + sx]:
+            continue
+        # Estende a faixa para os dois lados até sair da cor alvo
+        left = max(row, mask.rfind(b"\0", row, row + sx) + 1)
+        right = mask.find(b"\0", row + sx, row + w)
+        if right == -1:
+            right = row + w
+        plane[left:right] = fill * (right - left)
+        mask[left:right] = bytes(right - left)
+        x0, x1 = min(x0, left - row), max(x1, right - row)
+        y0, y1 = min(y0, sy), max(y1, sy + 1)
+
+        # Uma semente por faixa da cor alvo nas linhas de cima e de baixo
+        lo, hi = max(0, left - row - reach), min(w, right - row + reach)
+        for ny in (sy - 1, sy + 1):
+            if 0 <= ny < h:
+                nrow = ny * w
+                p = mask.find(b"\1", nrow + lo, nrow + hi)
+                while p != -1:
+                    stack.append((p - nrow, ny))
+                    end = mask.find(b"\0", p, nrow + hi)
+                    if end == -1:
+                        break
+                    p = mask.find(b"\1", end, nrow + hi)
+
     session._save_state()
-    for py in range(max(0, y), min(session.quantized.height, y + h)):
-        for px in range(max(0, x), min(session.quantized.width, x + w)):
-            if session.quantized.getpixel((px, py)) == f:
-                session.quantized.putpixel((px, py), t)
-    session._draw_grid()
+    bbox = (x0, y0, x1, y1)
+    patch = Image.frombytes("L", (w, h), bytes(plane)).crop(bbox)
+    session.quantized.paste(patch, bbox[:2])
+    # OTIMIZAÇÃO: Repinta só a caixa preenchida
+    session._mark_dirty(*bbox)
+    session._refresh_grid()
+    return bbox
 
 def get_row_summary(session: "TramaGridSession", row_num: int) -> Dict:
     """Retorna um resumo de uma linha específica"""
     if not session.quantized:
         return {"summary": []}
 
-    w, h = session.quantized.size
-    # Converte o número da carreira (1...H) para o índice da imagem (H-1...0)
-    img_row = h - row_num
-    if img_row < 0 or img_row >= h:
+    # OTIMIZAÇÃO: Lê as corridas do índice RLE por linha (já na ordem do zigue-zague)
+    runs = line_runs(session, row_num)
+    if runs is None:
         return {"summary": []}
 
     summary = []
-    curr_idx = None
-    count = 0
-
-    # ZigZag: Linhas ímpares (←), Linhas pares (→)
-    col_range = range(w - 1, -1, -1) if row_num % 2 != 0 else range(w)
-
-    for x in col_range:
-        idx = session.quantized.getpixel((x, img_row))
-        if idx == curr_idx:
-            count += 1
-        else:
-            if curr_idx is not None:
-                r, g, b = session.palette[curr_idx]
-                summary.append({"count": count, "hex": f"#{r:02x}{g:02x}{b:02x}"})
-            curr_idx, count = idx, 1
-
-    if curr_idx is not None:
-        r, g, b = session.palette[curr_idx]
+    for idx, count in runs:
+        r, g, b = session.palette[idx]
         summary.append({"count": count, "hex": f"#{r:02x}{g:02x}{b:02x}"})
 
     return {"summary": summary}
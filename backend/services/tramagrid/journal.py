@@ -0,0 +1,124 @@
+import os
+import json
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Nome do diário de operações dentro da pasta da sessão
+JOURNAL_FILE = "journal.jsonl"
+
+# Depois de tantas linhas o próximo salvamento compacta o diário em um snapshot
+JOURNAL_COMPACT_LINES = 500
+
+# Operações da sessão que podem ser reaplicadas a partir do diário (nome do método).
+# Desfazer/refazer entram como "restore" com a entrada aplicada: o histórico não vai para o
+# snapshot, então reaplicar só "undo" depois de recarregar desfaria outra coisa (ou nada).
+# "undo"/"redo" continuam aceitos para ler diários antigos.
+JOURNALED_OPS = {
+    "paint_cell", "replace_index_in_region", "remap_region", "flood_fill", "replace_color",
+    "merge_colors", "merge_many_colors", "delete_color", "add_color_to_palette", "undo", "redo",
+    "restore", "apply_batch",
+}
+
+# Parâmetros persistidos (snapshot e registros "params" do diário)
+PARAM_KEYS = [
+    "grid_width_cells", "max_colors", "quantizer", "brightness", "contrast", "saturation", "gamma",
+    "posterize", "gauge_stitches", "gauge_rows", "show_grid", "highlighted_row",
+]
+
+def get_params(session: "TramaGridSession") -> Dict:
+    return {k: getattr(session, k) for k in PARAM_KEYS}
+
+def record(session: "TramaGridSession", op: str, *args) -> None:
+    """Registra uma operação já aplicada para o próximo salvamento (ignorado no replay e dentro de um lote)"""
+    if session._replaying or session._in_transaction:
+        return
+    session._journal.append({"op": op, "args": list(args)})
+
+def require_snapshot(session: "TramaGridSession") -> None:
+    """Marca que o estado mudou de um jeito que o diário não reproduz (ex.: grade regerada)"""
+    session._journal = []
+    session._needs_snapshot = True
+
+def can_append(session: "TramaGridSession") -> bool:
+    """O próximo salvamento pode ser só um append no diário?"""
+    return (session._journal_gen > 0 and not session._needs_snapshot
+            and session._journal_lines < JOURNAL_COMPACT_LINES)
+
+def append_journal(session: "TramaGridSession", s_dir: str) -> None:
+    """OTIMIZAÇÃO: Salvamento O(1): anexa as operações pendentes (e parâmetros alterados) ao diário"""
+    records: List[Dict] = session._journal
+    params = get_params(session)
+    changed = {k: v for k, v in params.items() if session._journal_params.get(k) != v}
+    if changed:
+        records = records + [{"op": "params", "values": changed}]
+    if not records:
+        return
+
+    with open(os.path.join(s_dir, JOURNAL_FILE), "a") as f:
+        f.write("".join(json.dumps(r) + "\n" for r in records))
+
+    session._journal_lines += len(records)
+    session._journal = []
+    session._journal_params = params
+
+def reset_journal(session: "TramaGridSession", s_dir: str, gen: int) -> None:
+    """Começa um diário vazio para o snapshot da geração `gen`"""
+    path = os.path.join(s_dir, JOURNAL_FILE)
+    with open(path + ".tmp", "w") as f:
+        f.write(json.dumps({"gen": gen}) + "\n")
+    os.replace(path + ".tmp", path)
+
+    session._journal_gen = gen
+    session._journal_lines = 0
+    session._journal = []
+    session._journal_params = get_params(session)
+    session._needs_snapshot = False
+
+def replay_journal(session: "TramaGridSession", s_dir: str, gen: int) -> int:
+    """Reaplica o diário sobre o snapshot carregado (reconstruindo também o desfazer)
+
+    O cabeçalho do diário precisa ser da mesma geração do snapshot: um diário antigo, que
+    sobrou de uma compactação interrompida, é ignorado. Uma última linha incompleta (queda
+    no meio de um append) encerra o replay.
+    """
+    path = os.path.join(s_dir, JOURNAL_FILE)
+    applied = 0
+    session._journal_gen = gen
+    session._journal_lines = 0
+    if gen > 0 and os.path.exists(path):
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+        try:
+            header_gen = json.loads(lines[0]).get("gen") if lines else None
+        except ValueError:
+            header_gen = None
+
+        if header_gen == gen:
+            session._replaying = True
+            try:
+                for line in lines[1:]:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break
+                    if rec.get("op") == "params":
+                        for k, v in rec.get("values", {}).items():
+                            if k in PARAM_KEYS:
+                                setattr(session, k, v)
+                    elif rec.get("op") in JOURNALED_OPS:
+                        getattr(session, rec["op"])(*rec.get("args", []))
+                    applied += 1
+            finally:
+                session._replaying = False
+            session._journal_lines = applied
+        else:
+            # Sem diário válido para esta geração: o próximo salvamento grava um snapshot
+            session._needs_snapshot = True
+    else:
+        session._needs_snapshot = True
+
+    session._journal = []
+    session._journal_params = get_params(session)
+    return applied
@@ -0,0 +1,86 @@
+import base64
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageChops
+
+from .transaction import BATCH_OPS
+from .tiles import tile_ids
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Acima disso o diff vai como um retângulo de índices (bytes em base64) em vez de lista de células
+LIVE_MAX_CELLS = 4096
+
+# Operações de histórico aceitas pelo canal além das de lote
+HISTORY_OPS = {"undo", "redo"}
+
+# OTIMIZAÇÃO: Canal de edição por WebSocket. Cada mensagem aplica uma operação (ou um lote) e a
+# resposta é só o que mudou: células [x, y, índice], cores da paleta alteradas e os tiles a
+# buscar de novo, em vez de a grade inteira em PNG base64 a cada edição. O diff sai da
+# comparação do plano de índices antes/depois (um ImageChops.difference, em C), então vale para
+# qualquer operação da sessão, inclusive desfazer/refazer.
+
+Snapshot = Tuple[Tuple[int, int], bytes, Dict[int, Tuple[int, int, int]]]
+
+def snapshot(session: "TramaGridSession") -> Optional[Snapshot]:
+    """Estado comparável da grade: tamanho, plano de índices e paleta"""
+    if not session.quantized:
+        return None
+    return session.quantized.size, session.quantized.tobytes(), dict(session.palette)
+
+def _hex(rgb) -> str:
+    r, g, b = rgb
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def diff(session: "TramaGridSession", before: Optional[Snapshot]) -> Dict[str, Any]:
+    """O que mudou na grade desde `before` (reset=True quando o cliente deve recarregar tudo)"""
+    after = snapshot(session)
+    out: Dict[str, Any] = {"version": session.grid_version}
+    if before is None or after is None or before[0] != after[0]:
+        out["reset"] = True
+        return out
+
+    size = after[0]
+    old_pal, new_pal = before[2], after[2]
+    palette = {idx: _hex(rgb) for idx, rgb in new_pal.items() if old_pal.get(idx) != rgb}
+    palette.update({idx: None for idx in old_pal if idx not in new_pal})
+    if palette:
+        out["palette"] = palette
+
+    old = Image.frombytes("L", size, before[1])
+    new = Image.frombytes("L", size, after[1])
+    box = ImageChops.difference(old, new).getbbox()
+    if box:
+        x0, y0, x1, y1 = box
+        a = np.frombuffer(before[1], dtype=np.uint8).reshape(size[1], size[0])[y0:y1, x0:x1]
+        b = np.frombuffer(after[1], dtype=np.uint8).reshape(size[1], size[0])[y0:y1, x0:x1]
+        ys, xs = np.nonzero(a != b)
+        if len(xs) <= LIVE_MAX_CELLS:
+            out["cells"] = np.stack([xs + x0, ys + y0, b[ys, xs]], axis=1).tolist()
+        else:
+            out["region"] = {"box": list(box), "data": base64.b64encode(new.crop(box).tobytes()).decode()}
+
+    # Cor da paleta trocada: todo tile muda; senão, só os que cobrem a caixa alterada
+    if palette:
+        out["tiles"] = "all"
+    elif box:
+        out["tiles"] = tile_ids(box, *size)
+    return out
+
+def apply_message(session: "TramaGridSession", msg: Dict) -> Dict[str, Any]:
+    """Aplica uma mensagem do canal ({"op", "args"} ou {"ops": [...]}) e devolve o diff
+
+    Levanta ValueError para mensagens inválidas (a sessão fica como estava).
+    """
+    before = snapshot(session)
+    if "ops" in msg:
+        session.apply_batch(msg["ops"])
+    elif msg.get("op") in HISTORY_OPS:
+        getattr(session, msg["op"])()
+    elif msg.get("op") in BATCH_OPS:
+        # Uma operação vira um lote de uma: valida, desfaz tudo se falhar e renderiza uma vez
+        session.apply_batch([{"op": msg["op"], "args": msg.get("args", [])}])
+    else:
+        raise ValueError("Operação inválida")
+    return diff(session, before)
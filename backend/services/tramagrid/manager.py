@@ -0,0 +1,175 @@
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+from .session import TramaGridSession
+from .pipeline import stage_cache_nbytes
+
+# Imports com fallback para execução direta
+try:
+    from ...config import SESSION_CACHE_MB
+except ImportError:
+    # Fallback quando executado fora do pacote
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    from config import SESSION_CACHE_MB
+
+class SessionNotFound(KeyError):
+    """A sessão não está em memória nem no disco"""
+
+def _image_nbytes(img: Optional[Image.Image]) -> int:
+    return img.width * img.height * len(img.getbands()) if img is not None else 0
+
+def session_nbytes(session: TramaGridSession) -> int:
+    """Estimativa da memória ocupada por uma sessão (imagens, histórico e caches)"""
+    total = sum(_image_nbytes(img) for img in (
+        session._original, session.processed, session.quantized, session.grid_image, session._dimmed_image
+    ))
+    total += session.history_bytes + session.tiles.nbytes + stage_cache_nbytes(session)
+    if isinstance(session._original_blob, bytes):  # Mapeado do disco não conta
+        total += len(session._original_blob)
+    if session._pending_state is not None:
+        total += len(session._pending_state['quantized_data'])
+    if session._encoded_grid is not None:
+        total += len(session._encoded_grid[1])
+    return total
+
+class _Lease:
+    """Uso exclusivo de uma sessão: segura o lock dela até o fim do bloco `with`"""
+
+    def __init__(self, manager: "SessionManager", sid: str, session: TramaGridSession, lock):
+        self.manager = manager
+        self.sid = sid
+        self.session = session
+        self._lock = lock
+
+    def __enter__(self) -> TramaGridSession:
+        return self.session
+
+    def __exit__(self, exc_type, exc, tb):
+        self._lock.release()
+        self.manager._account(self.sid)
+        return False
+
+class SessionManager:
+    """Mantém as sessões vivas em memória com despejo LRU por orçamento de bytes
+
+    Sessões despejadas são gravadas com save_to_disk e recarregadas sob demanda. Cada sessão
+    tem um lock próprio: `with manager.use(sid) as s:` serializa requisições concorrentes
+    sobre a mesma sessão (pintura e geração não se intercalam).
+    """
+
+    def __init__(self, max_bytes: int = SESSION_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, TramaGridSession]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        # Só existe enquanto alguém segura ou espera o lock: sids inexistentes e sessões
+        # despejadas não deixam locks acumulando
+        self._locks: "weakref.WeakValueDictionary[str, threading.RLock]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lock_for(self, sid: str) -> threading.RLock:
+        with self._lock:
+            lock = self._locks.get(sid)
+            if lock is None:
+                lock = self._locks[sid] = threading.RLock()
+            return lock
+
+    def create(self) -> Tuple[str, TramaGridSession]:
+        """Cria uma sessão nova, já registrada e gravada no disco"""
+        sid = str(uuid.uuid4())
+        session = TramaGridSession()
+        session.save_to_disk(sid)
+        with self._lock:
+            self._sessions[sid] = session
+            self._sizes[sid] = session_nbytes(session)
+        return sid, session
+
+    def use(self, sid: str) -> _Lease:
+        """Obtém a sessão (carregando do disco se preciso) com o lock dela já adquirido"""
+        lock = self._lock_for(sid)
+        lock.acquire()
+        try:
+            with self._lock:
+                session = self._sessions.get(sid)
+                if session is not None:
+                    self._sessions.move_to_end(sid)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+            if session is None:
+                session = TramaGridSession()
+                if not session.load_from_disk(sid):
+                    raise SessionNotFound(sid)
+                with self._lock:
+                    self._sessions[sid] = session
+                    self._sizes[sid] = session_nbytes(session)
+        except BaseException:
+            lock.release()
+            raise
+        return _Lease(self, sid, session, lock)
+
+    def _account(self, sid: str) -> None:
+        """Atualiza o tamanho da sessão após o uso e despeja as menos usadas se passou do orçamento"""
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None:
+                self._sizes[sid] = session_nbytes(session)
+        self._evict_over_budget(keep=sid)
+
+    def _evict_over_budget(self, keep: Optional[str] = None) -> None:
+        while True:
+            with self._lock:
+                if sum(self._sizes.values()) <= self.max_bytes:
+                    return
+                # Mais antiga primeiro; pula a recém-usada e as que estão ocupadas
+                candidates = [s for s in self._sessions if s != keep]
+            for sid in candidates:
+                if self.evict(sid, blocking=False):
+                    break
+            else:
+                return
+
+    def evict(self, sid: str, blocking: bool = True) -> bool:
+        """Grava a sessão no disco e a retira da memória"""
+        lock = self._lock_for(sid)
+        if not lock.acquire(blocking):
+            return False
+        try:
+            with self._lock:
+                session = self._sessions.get(sid)
+            if session is None:
+                return False
+            session.save_to_disk(sid, lite=True)
+            with self._lock:
+                self._sessions.pop(sid, None)
+                self._sizes.pop(sid, None)
+                self.evictions += 1
+            return True
+        finally:
+            lock.release()
+
+    def stats(self) -> Dict:
+        """Contadores de acerto/falha e ocupação do cache de sessões"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "resident": len(self._sessions),
+                "bytes": sum(self._sizes.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+# Gerenciador global do processo
+session_manager = SessionManager()
@@ -0,0 +1,179 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from PIL import Image
+
+from .pipeline import STAGES, compute_stage, pending_stage, quantize_seed, stage_keys
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Imports com fallback para execução direta
+try:
+    from ...config import HEAVY_WORKERS, HEAVY_QUEUE_MAX, OFFLOAD_MIN_PIXELS
+except ImportError:
+    # Fallback quando executado fora do pacote
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    from config import HEAVY_WORKERS, HEAVY_QUEUE_MAX, OFFLOAD_MIN_PIXELS
+
+# OTIMIZAÇÃO: Trabalho pesado de CPU (estágios de generate_grid, exportação) roda em um pool de
+# processos limitado, fora do GIL do processo web: uma grade de 400 colunas sendo gerada não
+# atrasa a pintura de célula dos outros usuários. As imagens vão e voltam por memória
+# compartilhada (só o nome do bloco é serializado). Operações leves continuam no próprio processo.
+#
+# Admissão: no máximo HEAVY_WORKERS + HEAVY_QUEUE_MAX jobs em andamento; além disso o job é
+# recusado na hora com Overloaded (HTTP 503), em vez de crescer uma fila sem limite.
+
+class Overloaded(RuntimeError):
+    """Pool de trabalho pesado sem vaga (responder 503 e pedir para tentar de novo)"""
+
+# Referência a uma imagem em memória compartilhada: (nome do bloco, modo, tamanho, paleta)
+ImageRef = Tuple[str, str, Tuple[int, int], Optional[List[int]]]
+
+def share_image(img: Image.Image) -> Tuple[shared_memory.SharedMemory, ImageRef]:
+    """Copia os pixels para um bloco novo; quem cria o bloco é quem chama release()"""
+    data = img.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    palette = img.getpalette() if img.mode == "P" else None
+    return shm, (shm.name, img.mode, img.size, palette)
+
+def attach_image(ref: ImageRef, unlink: bool = False) -> Image.Image:
+    """Lê a imagem de um bloco compartilhado (cópia própria); unlink=True libera o bloco em seguida"""
+    name, mode, size, palette = ref
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        view = shm.buf[:len(shm.buf)]
+        img = Image.frombuffer(mode, size, view, "raw", mode, 0, 1).copy()
+        view.release()
+    finally:
+        shm.close()
+        if unlink:
+            shm.unlink()
+    if palette is not None:
+        img.putpalette(palette)
+    return img
+
+def release(shm: shared_memory.SharedMemory) -> None:
+    shm.close()
+    shm.unlink()
+
+class HeavyPool:
+    """Pool de processos com limite de jobs em andamento (executando + na fila)"""
+
+    def __init__(self, workers: int = HEAVY_WORKERS, queue_max: int = HEAVY_QUEUE_MAX):
+        self.workers = workers
+        self.capacity = max(1, workers) + queue_max
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # forkserver/spawn: os processos não herdam por fork as threads e os locks do
+            # servidor web (um fork no meio de um lock segurado trava o filho)
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._pool
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, fn, *args) -> Future:
+        """Agenda fn(*args) em um processo do pool (com HEAVY_WORKERS=0, executa aqui mesmo)"""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise Overloaded("Servidor ocupado, tente novamente em instantes")
+            self._in_flight += 1
+            try:
+                if self.workers > 0:
+                    try:
+                        future = self._executor().submit(fn, *args)
+                    except BrokenProcessPool:
+                        # Um processo morreu (ex.: falta de memória): recria o pool uma vez
+                        self._pool = None
+                        future = self._executor().submit(fn, *args)
+            except Exception:
+                self._in_flight -= 1
+                raise
+        if self.workers <= 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        future.add_done_callback(self._done)
+        return future
+
+    def run(self, fn, *args):
+        """submit() e espera o resultado"""
+        return self.submit(fn, *args).result()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"workers": self.workers, "capacity": self.capacity,
+                    "in_flight": self._in_flight, "rejected": self._rejected}
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+# Pool global do processo (compartilhado por geração de grade e exportação)
+heavy_pool = HeavyPool()
+
+def _pipeline_job(ref: ImageRef, names: Tuple[str, ...], keys: List[Tuple], seed) -> List[Optional[ImageRef]]:
+    """Roda no processo do pool: calcula os estágios em sequência e devolve cada resultado em um
+    bloco compartilhado novo (None quando o estágio devolveu a própria entrada)"""
+    source = attach_image(ref)
+    out = []
+    blocks = []
+    try:
+        for name, key in zip(names, keys):
+            result = compute_stage(name, source, key, seed)
+            if result is source:
+                out.append(None)
+            else:
+                shm, result_ref = share_image(result)
+                blocks.append(shm)
+                out.append(result_ref)
+            source = result
+    except BaseException:
+        # Um estágio falhou: os blocos já criados nunca chegariam ao processo web
+        for shm in blocks:
+            release(shm)
+        raise
+    for shm in blocks:
+        shm.close()  # Quem libera é o processo web, depois de ler
+    return out
+
+def offload_pipeline(session: "TramaGridSession") -> None:
+    """Calcula no pool os estágios de generate_grid que faltam e guarda em session._stage_cache
+
+    Depois disso run_pipeline só encontra estágios memorizados. Imagens pequenas (ou pool
+    desligado) ficam para run_pipeline calcular no próprio processo.
+    """
+    keys = stage_keys(session)
+    start, source = pending_stage(session, keys)
+    if start == len(STAGES) or heavy_pool.workers <= 0 or source.width * source.height < OFFLOAD_MIN_PIXELS:
+        return
+
+    names = STAGES[start:]
+    shm, ref = share_image(source)
+    try:
+        results = heavy_pool.run(_pipeline_job, ref, names, [keys[n] for n in names], quantize_seed(session))
+    finally:
+        release(shm)
+    for name, result_ref in zip(names, results):
+        img = source if result_ref is None else attach_image(result_ref, unlink=True)
+        session._stage_cache[name] = (source, keys[name], img)
+        source = img
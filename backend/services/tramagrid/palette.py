@@ -1,7 +1,8 @@
-import math
 from collections import defaultdict
 from typing import TYPE_CHECKING, List, Dict
 
+from .color_distance import DEFAULT_CLUSTER_DELTA_E, palette_distances
+
 if TYPE_CHECKING:
     from .session import TramaGridSession
 
@@ -97,14 +98,8 @@ def delete_color(session: "TramaGridSession", idx):
     if not c1:
         return  # Se a cor já não existe, sai
 
-    best, min_d = None, float('inf')
-    for i, c2 in session.palette.items():
-        if i == idx:
-            continue
-        # Distância Euclidiana simples
-        d = math.sqrt(sum((a - b) ** 2 for a, b in zip(c1, c2)))
-        if d < min_d:
-            min_d, best = d, i
+    # OTIMIZAÇÃO: Vizinho mais próximo pela matriz ΔE (CIELAB) da paleta
+    best = palette_distances(session.palette).nearest(idx)
 
     # Se achou uma cor substituta, aplica a troca rápida
     if best is not None:
@@ -156,29 +151,10 @@ def add_color_to_palette(session: "TramaGridSession", hex_val: str):
     session.palette[new_idx] = session.custom_palette[new_idx] = rgb
     return new_idx
 
-def suggest_clusters(session: "TramaGridSession", threshold=50.0):
-    """Sugere clusters de cores similares"""
+def suggest_clusters(session: "TramaGridSession", threshold=DEFAULT_CLUSTER_DELTA_E):
+    """Sugere clusters de cores similares (limiar em ΔE, CIELAB)"""
     if not session.palette:
         return []
 
-    colors = list(session.palette.items())
-    groups = []
-    visited = set()
-
-    for i in range(len(colors)):
-        idx1, rgb1 = colors[i]
-        if idx1 in visited:
-            continue
-        grp = [idx1]
-        for j in range(i + 1, len(colors)):
-            idx2, rgb2 = colors[j]
-            if idx2 in visited:
-                continue
-            if math.sqrt(sum((a - b) ** 2 for a, b in zip(rgb1, rgb2))) < threshold:
-                grp.append(idx2)
-                visited.add(idx2)
-        if len(grp) > 1:
-            visited.add(idx1)
-            groups.append(grp)
-
-    return groups
+    # OTIMIZAÇÃO: Agrupamento a partir da matriz ΔE pré-calculada em vez do laço O(n²) em Python
+    return palette_distances(session.palette).clusters(threshold)
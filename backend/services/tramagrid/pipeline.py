@@ -0,0 +1,144 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from PIL import Image, ImageEnhance, ImageStat
+
+from .quantize import quantize, palette_colors
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Imports com fallback para execução direta
+try:
+    from ...config import MAX_GRID_WIDTH_CELLS
+except ImportError:
+    # Fallback quando executado fora do pacote
+    import sys
+    import os
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    from config import MAX_GRID_WIDTH_CELLS
+
+# OTIMIZAÇÃO: generate_grid em estágios memorizados (ajustes -> redimensionamento -> quantização).
+# Cada estágio guarda (entrada, chave, resultado) em session._stage_cache e só refaz o trabalho
+# quando a imagem de entrada ou os parâmetros que o afetam mudam: mexer só em max_colors
+# refaz só a quantização.
+#
+# Os ajustes ponto a ponto viram LUTs construídas aplicando a própria operação do Pillow numa
+# rampa 0..255, então o resultado é idêntico ao das operações encadeadas. Posterização, gama e
+# brilho (quando a saturação é neutra) se fundem em um único point().
+
+_RAMP = Image.frombytes("L", (256, 1), bytes(range(256)))
+
+@lru_cache(maxsize=32)
+def _posterize_lut(bits: int) -> Tuple[int, ...]:
+    mask = ~(2 ** (8 - bits) - 1)
+    return tuple(i & mask for i in range(256))
+
+@lru_cache(maxsize=32)
+def _gamma_lut(gamma: float) -> Tuple[int, ...]:
+    return tuple(int(((i / 255.0) ** (1.0 / gamma)) * 255) for i in range(256))
+
+@lru_cache(maxsize=32)
+def _blend_lut(base: int, factor: float) -> Tuple[int, ...]:
+    """LUT de Image.blend(cor sólida `base`, imagem, factor): brilho (base 0) e contraste (base = média)"""
+    return tuple(Image.blend(Image.new("L", (256, 1), base), _RAMP, factor).tobytes())
+
+def _compose(*luts: Optional[Tuple[int, ...]]) -> Optional[List[int]]:
+    """Compõe LUTs na ordem dada (None = identidade)"""
+    luts = [lut for lut in luts if lut is not None]
+    if not luts:
+        return None
+    out = list(range(256))
+    for lut in luts:
+        out = [lut[v] for v in out]
+    return out
+
+def _apply(img: Image.Image, lut: Optional[List[int]]) -> Image.Image:
+    return img.point(lut * len(img.getbands())) if lut is not None else img
+
+def adjust_image(img: Image.Image, posterize: int, gamma: float, saturation: float,
+                 brightness: float, contrast: float) -> Image.Image:
+    """Posterização, gama, saturação, brilho e contraste (nesta ordem) com o mínimo de passes"""
+    post = _posterize_lut(max(1, min(8, int(posterize)))) if posterize < 8 else None
+    gam = _gamma_lut(gamma) if gamma != 1.0 else None
+    bright = _blend_lut(0, brightness) if brightness != 1.0 else None
+
+    if saturation != 1.0:
+        # A saturação mistura os canais: separa o que vem antes do que vem depois dela
+        img = _apply(img, _compose(post, gam))
+        img = ImageEnhance.Color(img).enhance(saturation)
+        img = _apply(img, _compose(bright))
+    else:
+        img = _apply(img, _compose(post, gam, bright))
+
+    if contrast != 1.0:
+        # O contraste depende da média da imagem já ajustada; com ela, também é uma LUT
+        mean = int(ImageStat.Stat(img.convert("L")).mean[0] + 0.5)
+        img = _apply(img, _compose(_blend_lut(mean, contrast)))
+    return img
+
+def _stage(session: "TramaGridSession", name: str, source, key: Tuple, compute):
+    """Devolve o resultado memorizado do estágio, recalculando só se a entrada ou a chave mudou"""
+    cached = session._stage_cache.get(name)
+    if cached is not None and cached[0] is source and cached[1] == key:
+        return cached[2]
+    result = compute()
+    session._stage_cache[name] = (source, key, result)
+    return result
+
+# Ordem dos estágios; a entrada de cada um é o resultado do anterior (a do primeiro é session.original)
+STAGES = ("adjust", "resize", "quantize")
+
+def stage_keys(session: "TramaGridSession") -> Dict[str, Tuple]:
+    """Parâmetros que afetam cada estágio (os ajustes não mudam o tamanho da imagem)"""
+    ratio = session.gauge_stitches / max(1, session.gauge_rows)
+    w, h = session.original.size
+    new_w = max(10, min(MAX_GRID_WIDTH_CELLS, session.grid_width_cells))
+    new_h = int((h / w) * new_w * ratio)
+    return {
+        "adjust": (session.posterize, session.gamma, session.saturation, session.brightness, session.contrast),
+        "resize": (new_w, new_h),
+        "quantize": (session.max_colors, session.quantizer),
+    }
+
+def quantize_seed(session: "TramaGridSession") -> Optional[List[Tuple[int, int, int]]]:
+    """Semente: a paleta da quantização anterior (o k-means converge rápido após um ajuste pequeno)"""
+    previous = session._stage_cache.get("quantize")
+    return palette_colors(previous[2], session.max_colors) if previous else None
+
+def compute_stage(name: str, img: Image.Image, key: Tuple, seed=None) -> Image.Image:
+    """Calcula um estágio sem tocar na sessão (também roda nos processos de trabalho)"""
+    if name == "adjust":
+        return adjust_image(img, *key)
+    if name == "resize":
+        return img.resize(key, Image.Resampling.LANCZOS)
+    return quantize(img, key[0], key[1], seed)
+
+def pending_stage(session: "TramaGridSession", keys: Dict[str, Tuple]) -> Tuple[int, Image.Image]:
+    """Posição do primeiro estágio a recalcular e a imagem de entrada dele"""
+    source = session.original
+    for i, name in enumerate(STAGES):
+        cached = session._stage_cache.get(name)
+        if cached is None or cached[0] is not source or cached[1] != keys[name]:
+            return i, source
+        source = cached[2]
+    return len(STAGES), source
+
+def run_pipeline(session: "TramaGridSession") -> Tuple[Image.Image, Image.Image]:
+    """Executa os estágios e devolve (processed, quantized); quantized já é uma cópia editável"""
+    keys = stage_keys(session)
+    seed = quantize_seed(session)
+    source = session.original
+    for name in STAGES:
+        source = _stage(session, name, source, keys[name],
+                        lambda name=name, img=source: compute_stage(name, img, keys[name], seed))
+    processed = session._stage_cache["resize"][2]
+    # A grade é editada no lugar; o resultado memorizado não pode ser tocado
+    return processed, source.copy()
+
+def stage_cache_nbytes(session: "TramaGridSession") -> int:
+    """Memória ocupada pelos resultados intermediários memorizados (sem contar session.processed)"""
+    total = 0
+    for source, _, img in session._stage_cache.values():
+        if img is not source and img is not session.processed:
+            total += img.width * img.height * len(img.getbands())
+    return total
@@ -0,0 +1,119 @@
+import json
+import struct
+import zlib
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+import numpy as np
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Alterações guardadas para respostas incrementais (mais antigas que isso: plano inteiro)
+PLANE_LOG_SIZE = 256
+
+# Codificações do plano: zlib sobre os bytes crus, RLE em ordem de linha, ou os bytes crus
+PLANE_ENCODINGS = ("zlib", "rle", "raw")
+
+# Resposta binária: magic, tamanho do cabeçalho JSON, cabeçalho, dados
+PLANE_MAGIC = b"TGPL"
+_PREFIX = struct.Struct("<4sI")
+
+# OTIMIZAÇÃO: O plano de índices (um byte por célula) e a paleta bastam para o cliente desenhar o
+# gráfico sozinho: 400x600 são 240 KB crus e poucos KB comprimidos, contra MB de PNG renderizado.
+# Cada edição (grid.mark_dirty) incrementa session.plane_version e registra o retângulo
+# alterado; um cliente que já tem a versão N recebe só o recorte que cobre as mudanças desde N.
+# Trocar o objeto do plano (regerar, mesclar cores, desfazer uma mudança de tamanho) zera o
+# registro, e a próxima resposta volta a ser o plano inteiro.
+
+def _check_plane(session: "TramaGridSession") -> None:
+    if session._plane_ref is not session.quantized:
+        session._plane_ref = session.quantized
+        session.plane_version += 1
+        session._plane_base = session.plane_version
+        session._plane_log.clear()
+
+def note_change(session: "TramaGridSession", box: Tuple[int, int, int, int]) -> None:
+    """Registra um retângulo de células alterado no plano (chamado por grid.mark_dirty)"""
+    _check_plane(session)
+    session.plane_version += 1
+    session._plane_log.append((session.plane_version, box))
+
+def plane_token(session: "TramaGridSession") -> str:
+    """Versão do plano como o cliente a vê: identifica também a instância da sessão"""
+    _check_plane(session)
+    return f"{session._render_id}-{session.plane_version}"
+
+def _changed_box(session: "TramaGridSession", since: Optional[str]) -> Optional[Tuple[int, int, int, int]]:
+    """Caixa alterada desde `since`, () se nada mudou, ou None se só o plano inteiro serve"""
+    if not since:
+        return None
+    render_id, _, version = since.partition("-")
+    if render_id != session._render_id or not version.isdigit():
+        return None
+    version = int(version)
+    log = session._plane_log
+    if version < session._plane_base or version > session.plane_version:
+        return None
+    if log and log[0][0] > version + 1:
+        return None  # Parte das mudanças já saiu do registro
+    boxes = [box for v, box in log if v > version]
+    if not boxes:
+        return ()
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+def rle_encode(data: bytes) -> bytes:
+    """Carreiras (índice uint8, quantidade uint16 LE) em ordem de linha; carreiras longas são divididas"""
+    a = np.frombuffer(data, dtype=np.uint8)
+    if not len(a):
+        return b""
+    starts = np.flatnonzero(np.concatenate(([True], a[1:] != a[:-1])))
+    counts = np.diff(np.append(starts, len(a)))
+    values = a[starts]
+    if counts.max() > 0xFFFF:
+        reps = (counts + 0xFFFE) // 0xFFFF
+        values = np.repeat(values, reps)
+        split = np.full(int(reps.sum()), 0xFFFF)
+        split[np.cumsum(reps) - 1] = counts - (reps - 1) * 0xFFFF
+        counts = split
+    out = np.empty(len(values), dtype=[("idx", "u1"), ("count", "<u2")])
+    out["idx"] = values
+    out["count"] = counts
+    return out.tobytes()
+
+def encode_plane(session: "TramaGridSession", encoding: str = "zlib", since: Optional[str] = None) -> Tuple[Dict[str, Any], bytes]:
+    """Cabeçalho (versão, tamanho, caixa, paleta) e dados do plano de índices
+
+    Com `since` (a versão que o cliente já tem), os dados cobrem só a caixa alterada desde
+    então; "box" nulo quer dizer que o plano não mudou (a paleta vem sempre).
+    """
+    if encoding not in PLANE_ENCODINGS:
+        raise ValueError("Codificação inválida")
+    if not session.quantized:
+        raise ValueError("Grade não gerada")
+
+    q = session.quantized
+    token = plane_token(session)
+    box = _changed_box(session, since)
+    full = box is None
+    if full:
+        box = (0, 0) + q.size
+
+    data = b""
+    if box:
+        raw = (q if full else q.crop(box)).tobytes()
+        data = zlib.compress(raw) if encoding == "zlib" else rle_encode(raw) if encoding == "rle" else raw
+    header = {
+        "version": token,
+        "width": q.width,
+        "height": q.height,
+        "encoding": encoding,
+        "full": full,
+        "box": list(box) if box else None,
+        "palette": {idx: f"#{r:02x}{g:02x}{b:02x}" for idx, (r, g, b) in session.palette.items()}
+    }
+    return header, data
+
+def pack_plane(header: Dict[str, Any], data: bytes) -> bytes:
+    """Resposta binária: TGPL + tamanho do cabeçalho (uint32 LE) + cabeçalho JSON + dados"""
+    meta = json.dumps(header, separators=(",", ":")).encode()
+    return _PREFIX.pack(PLANE_MAGIC, len(meta)) + meta + data
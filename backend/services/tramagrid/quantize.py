@@ -0,0 +1,122 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from PIL import Image
+
+# Interface dos quantizadores: (imagem RGB, nº de cores, paleta semente opcional) -> imagem "P"
+# cujas primeiras `colors` entradas da paleta são as cores usadas. Todos usam Floyd-Steinberg.
+Quantizer = Callable[[Image.Image, int, Optional[Sequence[Tuple[int, int, int]]]], Image.Image]
+
+DEFAULT_QUANTIZER = "mediancut"
+
+# k-means: limite de iterações e parada antecipada (deslocamento máximo dos centros, em níveis 0..255)
+KMEANS_MAX_ITER = 20
+KMEANS_TOL = 0.5
+KMEANS_SEED = 0
+
+# Caixas do histograma de cores usado pelo k-means (5 bits por canal)
+HIST_BINS = 1 << 15
+
+def quantize_mediancut(img: Image.Image, colors: int, seed_palette=None) -> Image.Image:
+    """Median cut do Pillow (o comportamento original de generate_grid)"""
+    return img.quantize(colors=colors, method=Image.MEDIANCUT, dither=Image.FLOYDSTEINBERG)
+
+def quantize_fastoctree(img: Image.Image, colors: int, seed_palette=None) -> Image.Image:
+    """Octree rápida do Pillow: a mais barata, com erro um pouco maior"""
+    return img.quantize(colors=colors, method=Image.FASTOCTREE, dither=Image.FLOYDSTEINBERG)
+
+def _color_histogram(img: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+    """Cores da imagem agrupadas em caixas de 5 bits por canal: (cor média de cada caixa, nº de pixels)
+
+    O k-means roda sobre as caixas (no máximo 32768, em geral bem menos) em vez dos pixels.
+    """
+    rgb = np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+    key = ((rgb[:, 0] >> 3).astype(np.int32) << 10) | ((rgb[:, 1] >> 3).astype(np.int32) << 5) | (rgb[:, 2] >> 3)
+    counts = np.bincount(key, minlength=HIST_BINS)
+    used = np.nonzero(counts)[0]
+    sums = np.stack([np.bincount(key, weights=rgb[:, c], minlength=HIST_BINS)[used] for c in range(3)], axis=1)
+    weights = counts[used].astype(np.float32)
+    return (sums / weights[:, None]).astype(np.float32), weights
+
+def _sq_dist(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Distâncias ao quadrado (pontos x centros) via ||p||² - 2p·c + ||c||²"""
+    d = (points * points).sum(1)[:, None] - 2.0 * points @ centers.T + (centers * centers).sum(1)[None, :]
+    return np.maximum(d, 0.0, out=d)
+
+def _nearest(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Índice do centro mais próximo (||p||² é constante por linha e fica de fora)"""
+    return ((centers * centers).sum(1)[None, :] - 2.0 * points @ centers.T).argmin(1)
+
+def _kmeans_pp(points: np.ndarray, weights: np.ndarray, centers: List[np.ndarray], k: int,
+               rng: np.random.Generator) -> np.ndarray:
+    """Completa `centers` até k pelo k-means++ ponderado pela contagem de cada cor"""
+    if not centers:
+        centers = [points[rng.choice(len(points), p=weights / weights.sum())]]
+    closest = _sq_dist(points, np.array(centers)).min(1)
+    while len(centers) < k:
+        prob = closest * weights
+        total = prob.sum()
+        if total <= 0:
+            break  # Menos cores distintas que k
+        c = points[rng.choice(len(points), p=prob / total)]
+        centers.append(c)
+        closest = np.minimum(closest, _sq_dist(points, c[None, :])[:, 0])
+    return np.array(centers, dtype=np.float32)
+
+def kmeans_palette(img: Image.Image, colors: int,
+                   seed_palette: Optional[Sequence[Tuple[int, int, int]]] = None) -> List[Tuple[int, int, int]]:
+    """Paleta por k-means (Lloyd vetorizado), com inicialização k-means++ ou a partir de uma paleta anterior
+
+    Semear com a paleta anterior faz um ajuste pequeno de parâmetros convergir em poucas iterações.
+    """
+    points, weights = _color_histogram(img)
+    k = min(colors, len(points))
+    rng = np.random.default_rng(KMEANS_SEED)
+    seeds = [np.array(c, dtype=np.float32) for c in (seed_palette or [])[:k]]
+    centers = _kmeans_pp(points, weights, seeds, k, rng)
+
+    for _ in range(KMEANS_MAX_ITER):
+        labels = _nearest(points, centers)
+        counts = np.bincount(labels, weights=weights, minlength=len(centers))
+        sums = np.stack([np.bincount(labels, weights=points[:, c] * weights, minlength=len(centers))
+                         for c in range(3)], axis=1)
+        new = centers.copy()
+        filled = counts > 0
+        new[filled] = sums[filled] / counts[filled, None]
+        shift = np.abs(new - centers).max()
+        centers = new
+        if shift < KMEANS_TOL:
+            break
+
+    return [tuple(int(v) for v in c) for c in np.clip(np.rint(centers), 0, 255)]
+
+def quantize_kmeans(img: Image.Image, colors: int, seed_palette=None) -> Image.Image:
+    """k-means na paleta + mapeamento com Floyd-Steinberg para essa paleta"""
+    palette = kmeans_palette(img, colors, seed_palette)
+    k = len(palette)
+    # Paleta repetida até 256 entradas: o Pillow pode escolher qualquer cópia, o point() volta para i % k
+    flat = [v for i in range(256) for v in palette[i % k]]
+    pal_img = Image.new("P", (1, 1))
+    pal_img.putpalette(flat)
+    out = img.quantize(palette=pal_img, dither=Image.FLOYDSTEINBERG)
+    out = out.point([i % k for i in range(256)])
+    out.putpalette([v for c in palette for v in c])
+    return out
+
+QUANTIZERS: Dict[str, Quantizer] = {
+    "mediancut": quantize_mediancut,
+    "fastoctree": quantize_fastoctree,
+    "kmeans": quantize_kmeans,
+}
+
+def quantize(img: Image.Image, colors: int, method: str = DEFAULT_QUANTIZER,
+             seed_palette: Optional[Sequence[Tuple[int, int, int]]] = None) -> Image.Image:
+    """Quantiza com o motor escolhido; `seed_palette` só é usada por quem sabe aproveitá-la (kmeans)"""
+    engine = QUANTIZERS.get(method)
+    if engine is None:
+        raise ValueError(f"Quantizador desconhecido: {method}")
+    return engine(img, colors, seed_palette)
+
+def palette_colors(img: Image.Image, colors: int) -> List[Tuple[int, int, int]]:
+    """As `colors` primeiras cores da paleta de uma imagem quantizada"""
+    raw = img.getpalette() or []
+    return [tuple(raw[i:i + 3]) for i in range(0, min(len(raw), colors * 3) - 2, 3)]
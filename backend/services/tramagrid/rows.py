@@ -0,0 +1,93 @@
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Carreiras por página no endpoint de instruções
+ROWS_PAGE_SIZE = 200
+
+Runs = Tuple[Tuple[int, int], ...]
+
+# OTIMIZAÇÃO: Índice RLE por linha da imagem, (índice, quantidade) da esquerda para a direita.
+# Calculado sob demanda e guardado em session._row_runs; grid.mark_dirty descarta só as linhas
+# editadas e trocar o plano de índices (merge, regerar a grade) descarta tudo. O zigue-zague
+# das carreiras é aplicado na leitura.
+
+def _runs(row: np.ndarray) -> Runs:
+    starts = np.flatnonzero(np.concatenate(([True], row[1:] != row[:-1])))
+    counts = np.diff(np.append(starts, len(row)))
+    return tuple(zip(row[starts].tolist(), counts.tolist()))
+
+def _check_plane(session: "TramaGridSession") -> None:
+    if session._row_plane is not session.quantized:
+        session._row_runs = {}
+        session._row_plane = session.quantized
+
+def invalidate_rows(session: "TramaGridSession", y0: int, y1: int) -> None:
+    """Descarta o índice das linhas y0..y1-1 da imagem"""
+    if not session._row_runs:
+        return
+    for y in range(y0, y1):
+        session._row_runs.pop(y, None)
+
+def _fill_rows(session: "TramaGridSession", y0: int, y1: int) -> None:
+    """Calcula as linhas y0..y1-1 que faltam no índice (um único recorte do plano)"""
+    _check_plane(session)
+    missing = [y for y in range(y0, y1) if y not in session._row_runs]
+    if not missing:
+        return
+    w = session.quantized.width
+    y0, y1 = missing[0], missing[-1] + 1
+    band = np.frombuffer(session.quantized.crop((0, y0, w, y1)).tobytes(), dtype=np.uint8).reshape(y1 - y0, w)
+    for y in missing:
+        session._row_runs[y] = _runs(band[y - y0])
+
+def row_runs(session: "TramaGridSession", y: int) -> Runs:
+    """Corridas da linha `y` da imagem, da esquerda para a direita"""
+    _fill_rows(session, y, y + 1)
+    return session._row_runs[y]
+
+def line_runs(session: "TramaGridSession", line_num: int) -> Optional[Runs]:
+    """Corridas da carreira `line_num` (1 = linha de baixo) na ordem de tricô
+
+    Carreiras ímpares são lidas da direita para a esquerda (←), pares da esquerda para a direita (→).
+    """
+    h = session.quantized.height
+    if not 1 <= line_num <= h:
+        return None
+    runs = row_runs(session, h - line_num)
+    return runs[::-1] if line_num % 2 != 0 else runs
+
+def line_arrow(line_num: int) -> str:
+    return "←" if line_num % 2 != 0 else "→"
+
+def iter_lines(session: "TramaGridSession", start: int = 1, count: Optional[int] = None) -> Iterator[Tuple[int, Runs]]:
+    """(carreira, corridas) de `start` em diante, na ordem de tricô"""
+    h = session.quantized.height
+    start = max(1, start)
+    end = h if count is None else min(h, start + count - 1)
+    if start <= end:
+        _fill_rows(session, h - end, h - start + 1)
+    for line_num in range(start, end + 1):
+        yield line_num, line_runs(session, line_num)
+
+def rows_page(session: "TramaGridSession", start: int = 1, limit: int = ROWS_PAGE_SIZE) -> Dict:
+    """Uma página de instruções: cabeçalho (paleta, total, próxima página) + carreiras"""
+    h = session.quantized.height if session.quantized else 0
+    start = max(1, start)
+    limit = max(1, min(limit, ROWS_PAGE_SIZE))
+    lines: List[Dict] = []
+    if session.quantized:
+        lines = [{"line": n, "arrow": line_arrow(n), "runs": [list(r) for r in runs]}
+                 for n, runs in iter_lines(session, start, limit)]
+    nxt = start + limit if start + limit <= h else None
+    return {
+        "header": {
+            "lines": h,
+            "start": start,
+            "next": nxt,
+            "palette": {idx: f"#{r:02x}{g:02x}{b:02x}" for idx, (r, g, b) in session.palette.items()}
+        },
+        "lines": lines
+    }
@@ -1,23 +1,40 @@
 import os
+import uuid
 from pathlib import Path
-from typing import Optional, Dict, Tuple, List, Any
+from collections import deque
+from typing import Optional, Deque, Dict, Tuple, List, Any
 from PIL import Image
 
-from .storage import save_to_disk, load_from_disk, _save_state
-from .image_ops import load_image, paint_cell, get_pixel_index, replace_index_in_region, get_row_summary
+from .storage import save_to_disk, load_from_disk
+from .image_ops import (
+    open_working_copy, load_image, paint_cell, get_pixel_index, replace_index_in_region, remap_region,
+    flood_fill, get_row_summary
+)
 from .palette import (
     get_palette_info, replace_color, merge_colors, merge_many_colors,
     delete_color, add_color_to_palette, suggest_clusters
 )
-from .grid import generate_grid, draw_grid, get_grid_base64
-from .history import undo, redo
+from .grid import generate_grid, draw_grid, refresh_grid, mark_dirty, get_grid_base64, grid_etag, encode_grid
+from .history import save_state, clear_history, undo, redo, restore, entry_to_record
 from .export import export_png, export_pdf
+from .tiles import TileCache, get_tile_info, get_tile_png, tile_etag
+from .journal import record, require_snapshot
+from .transaction import apply_batch
+from .rows import ROWS_PAGE_SIZE, rows_page
+from .quantize import DEFAULT_QUANTIZER
+from .color_distance import DEFAULT_CLUSTER_DELTA_E
+from .plane import PLANE_LOG_SIZE, encode_plane
 
 class TramaGridSession:
     """Classe principal da sessão TramaGrid que delega operações para módulos especializados"""
 
     def __init__(self):
-        self.original: Optional[Image.Image] = None
+        # Cópia de trabalho do original, decodificada sob demanda de _original_blob (ver a propriedade original)
+        self._original: Optional[Image.Image] = None
+        self._original_blob: Optional[bytes] = None
+
+        # Resultados memorizados dos estágios de generate_grid (ver pipeline.py)
+        self._stage_cache: Dict[str, Tuple] = {}
         self.processed: Optional[Image.Image] = None
         self.quantized: Optional[Image.Image] = None
         self.palette: Dict[int, Tuple[int, int, int]] = {}
@@ -25,12 +42,52 @@ class TramaGridSession:
         self.grid_image: Optional[Image.Image] = None
         self.history: List[Dict[str, Any]] = []
         self.redo_history: List[Dict[str, Any]] = []
+        self.history_bytes: int = 0  # Soma das entradas de desfazer + refazer (ver history.py)
+        self._pending_state: Optional[Dict[str, Any]] = None
+
+        # Estado da renderização incremental (ver grid.refresh_grid)
+        self._dirty_rects: List[Tuple[int, int, int, int]] = []
+        self._grid_state: Optional[Tuple] = None
+        self.grid_version: int = 0  # Incrementa a cada mudança em grid_image
+
+        # Cópia escurecida da grade para o destaque de carreira (ver grid.encode_grid)
+        self._dimmed_image: Optional[Image.Image] = None
+        self._dimmed_version: int = -1
+
+        # Última grade codificada (etag, bytes) e o identificador desta instância nas ETags:
+        # grid_version recomeça quando a sessão é recarregada do disco
+        self._encoded_grid: Optional[Tuple[str, bytes]] = None
+        self._render_id: str = uuid.uuid4().hex[:12]
+
+        # Índice RLE por linha para as instruções de carreira (ver rows.py)
+        self._row_runs: Dict[int, Tuple] = {}
+        self._row_plane: Optional[Image.Image] = None
+
+        # Tiles PNG por nível de zoom (ver tiles.py)
+        self.tiles: TileCache = TileCache()
+
+        # Versão do plano de índices e retângulos alterados por versão (ver plane.py)
+        self.plane_version: int = 0
+        self._plane_log: Deque[Tuple[int, Tuple[int, int, int, int]]] = deque(maxlen=PLANE_LOG_SIZE)
+        self._plane_base: int = 0
+        self._plane_ref: Optional[Image.Image] = None
+
+        # Diário de operações para salvamento incremental (ver journal.py)
+        self._journal: List[Dict[str, Any]] = []
+        self._journal_params: Dict[str, Any] = {}
+        self._journal_gen: int = 0  # Geração do snapshot em disco (0 = nenhum)
+        self._journal_lines: int = 0
+        self._needs_snapshot: bool = True
+        self._replaying: bool = False
+        self._render_deferred: bool = False
+        self._in_transaction: bool = False  # Dentro de apply_batch (ver transaction.py)
 
         # Parâmetros de configuração
         self.grid_width_cells: int = 130
         self.cell_size: int = 22
         self.highlighted_row: int = -1
         self.max_colors: int = 64
+        self.quantizer: str = DEFAULT_QUANTIZER  # Motor de quantização (ver quantize.QUANTIZERS)
         self.brightness: float = 1.0
         self.contrast: float = 1.0
         self.saturation: float = 1.0
@@ -41,6 +98,19 @@ class TramaGridSession:
         self.show_grid: bool = True
         # REMOVIDA: self.history: List[Dict[str, Any]] = [] (estava duplicada)
 
+    @property
+    def original(self) -> Optional[Image.Image]:
+        # OTIMIZAÇÃO: Restaurar uma sessão não decodifica o original; só quem regera a grade paga
+        if self._original is None and self._original_blob is not None:
+            self._original = open_working_copy(self._original_blob)
+        return self._original
+
+    @original.setter
+    def original(self, img: Optional[Image.Image]) -> None:
+        self._original = img
+        self._original_blob = None  # Codificação antiga não vale mais
+        self._stage_cache = {}
+
     # Delegações para storage.py
     def save_to_disk(self, session_id: str, lite: bool = False):
         save_to_disk(self, session_id, lite)
@@ -49,66 +119,130 @@ class TramaGridSession:
         return load_from_disk(self, session_id)
 
     def _save_state(self):
-        _save_state(self)
+        save_state(self)
+
+    def clear_history(self):
+        clear_history(self)
 
     # Delegações para image_ops.py
     def load_image(self, file_bytes: bytes) -> None:
         load_image(self, file_bytes)
+        require_snapshot(self)
 
     def paint_cell(self, x, y, idx):
         paint_cell(self, x, y, idx)
+        record(self, "paint_cell", x, y, idx)
 
     def get_pixel_index(self, x, y):
         return get_pixel_index(self, x, y)
 
     def replace_index_in_region(self, x, y, w, h, f, t):
         replace_index_in_region(self, x, y, w, h, f, t)
+        record(self, "replace_index_in_region", x, y, w, h, f, t)
+
+    def remap_region(self, x, y, w, h, table, invert=False):
+        remap_region(self, x, y, w, h, table, invert)
+        record(self, "remap_region", x, y, w, h, {str(k): v for k, v in table.items()}, invert)
+
+    def flood_fill(self, x, y, idx, connectivity=4):
+        bbox = flood_fill(self, x, y, idx, connectivity)
+        record(self, "flood_fill", x, y, idx, connectivity)
+        return bbox
 
     def get_row_summary(self, row_num: int):
         return get_row_summary(self, row_num)
 
+    # Delegações para rows.py
+    def get_rows_page(self, start: int = 1, limit: int = ROWS_PAGE_SIZE) -> Dict:
+        return rows_page(self, start, limit)
+
     # Delegações para palette.py
     def get_palette_info(self) -> List[Dict]:
         return get_palette_info(self)
 
     def replace_color(self, idx, hex_val):
         replace_color(self, idx, hex_val)
+        record(self, "replace_color", idx, hex_val)
 
     def merge_colors(self, f, t):
         merge_colors(self, f, t)
+        record(self, "merge_colors", f, t)
 
     def merge_many_colors(self, from_list, to_index):
         merge_many_colors(self, from_list, to_index)
+        record(self, "merge_many_colors", list(from_list), to_index)
 
     def delete_color(self, idx):
         delete_color(self, idx)
+        record(self, "delete_color", idx)
 
     def add_color_to_palette(self, hex_val: str):
-        return add_color_to_palette(self, hex_val)
+        idx = add_color_to_palette(self, hex_val)
+        record(self, "add_color_to_palette", hex_val)
+        return idx
 
-    def suggest_clusters(self, threshold=50.0):
+    def suggest_clusters(self, threshold=DEFAULT_CLUSTER_DELTA_E):
         return suggest_clusters(self, threshold)
 
+    # Delegações para transaction.py
+    def apply_batch(self, ops: List[Dict]) -> List[Any]:
+        results = apply_batch(self, ops)
+        record(self, "apply_batch", ops)
+        return results
+
     # Delegações para grid.py
     def generate_grid(self) -> None:
         generate_grid(self)
+        require_snapshot(self)
 
     def _draw_grid(self) -> None:
         draw_grid(self)
 
+    def _mark_dirty(self, x0, y0, x1, y1) -> None:
+        mark_dirty(self, x0, y0, x1, y1)
+
+    def _refresh_grid(self) -> None:
+        refresh_grid(self)
+
     def get_grid_base64(self) -> str:
         return get_grid_base64(self)
 
+    def grid_etag(self, fmt: str = "png", level: Optional[int] = None) -> str:
+        return grid_etag(self, fmt, level)
+
+    def encode_grid(self, fmt: str = "png", level: Optional[int] = None) -> Tuple[str, bytes]:
+        return encode_grid(self, fmt, level)
+
+    def encode_plane(self, encoding: str = "zlib", since: Optional[str] = None) -> Tuple[Dict, bytes]:
+        return encode_plane(self, encoding, since)
+
+    # Delegações para tiles.py
+    def get_tile_info(self) -> Dict:
+        return get_tile_info(self)
+
+    def get_tile_png(self, z: int, tx: int, ty: int) -> bytes:
+        return get_tile_png(self, z, tx, ty)
+
+    def tile_etag(self, z: int, tx: int, ty: int) -> str:
+        return tile_etag(self, z, tx, ty)
+
     # Delegações para history.py
     def undo(self):
-        undo(self)
+        entry = undo(self)
+        if entry is not None:
+            record(self, "restore", "undo", entry_to_record(entry))
 
     def redo(self):
-        redo(self)
+        entry = redo(self)
+        if entry is not None:
+            record(self, "restore", "redo", entry_to_record(entry))
+
+    def restore(self, direction: str, rec: Dict):
+        restore(self, direction, rec)
 
     # Delegações para export.py
     def export_png(self):
         return export_png(self)
 
-    def export_pdf(self, sid: str):
-        return export_pdf(self, sid)
+    def export_pdf(self, sid: str, progress=None):
+        return export_pdf(self, sid, progress)
@@ -1,6 +1,11 @@
 import os
 import json
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict
+from PIL import Image
+
+from .grid import palette_lut
+from .container import CONTAINER_FILE, write_container, read_container, encode_original
+from .journal import get_params, can_append, append_journal, reset_journal, replay_journal
 
 if TYPE_CHECKING:
     from .session import TramaGridSession
@@ -15,70 +20,99 @@ except ImportError:
     sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
     from config import DATA_DIR
 
+# Arquivos do formato antigo (uma pasta com meta.json + PNGs)
+LEGACY_FILES = ("meta.json", "quantized.png", "original.png")
+
 def save_to_disk(session: "TramaGridSession", session_id: str, lite: bool = False):
-    """Salva o estado da sessão no disco"""
+    """Salva o estado da sessão no disco (append no diário quando possível, senão snapshot)"""
     s_dir = os.path.join(DATA_DIR, session_id)
     os.makedirs(s_dir, exist_ok=True)
 
-    meta = {
-        "params": {
-            "grid_width_cells": session.grid_width_cells,
-            "max_colors": session.max_colors,
-            "brightness": session.brightness,
-            "contrast": session.contrast,
-            "saturation": session.saturation,
-            "gamma": session.gamma,
-            "posterize": session.posterize,
-            "gauge_stitches": session.gauge_stitches,
-            "gauge_rows": session.gauge_rows,
-            "show_grid": session.show_grid,
-            "highlighted_row": session.highlighted_row
-        },
-        "palette": {str(k): v for k, v in session.palette.items()},
-        "custom_palette": {str(k): v for k, v in session.custom_palette.items()}
-    }
+    # OTIMIZAÇÃO: Edições leves viram só um append no diário de operações
+    if lite and can_append(session):
+        append_journal(session, s_dir)
+        return
 
-    with open(os.path.join(s_dir, "meta.json"), "w") as f:
-        json.dump(meta, f)
+    _write_snapshot(session, s_dir, lite)
 
-    # OTIMIZAÇÃO: Se for 'lite', NÃO salva a original de novo
-    if session.original and not lite:
-        session.original.save(os.path.join(s_dir, "original.png"))
+def _write_snapshot(session: "TramaGridSession", s_dir: str, lite: bool):
+    """Grava o snapshot completo (contêiner session.bin) e compacta o diário"""
+    gen = session._journal_gen + 1
+    header = {
+        "params": get_params(session),
+        "palette": {str(k): v for k, v in session.palette.items()},
+        "custom_palette": {str(k): v for k, v in session.custom_palette.items()},
+        "journal_gen": gen
+    }
 
-    if session.quantized:
-        session.quantized.save(os.path.join(s_dir, "quantized.png"))
+    # OTIMIZAÇÃO: O original é codificado uma vez só e reaproveitado nos snapshots seguintes
+    if session._original_blob is None and session._original is not None:
+        session._original_blob = encode_original(session._original)
+
+    path = os.path.join(s_dir, CONTAINER_FILE)
+    write_container(path, header, session.quantized, session._original_blob)
+    _remove_legacy_files(s_dir)
+    if isinstance(session._original_blob, bytes):
+        # O arquivo original passa a ser lido do disco (mapeado) em vez de ficar na memória
+        session._original_blob = read_container(path)[2]
+
+    reset_journal(session, s_dir, gen)
+
+def _remove_legacy_files(s_dir: str) -> None:
+    for name in LEGACY_FILES:
+        path = os.path.join(s_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+def _apply_header(session: "TramaGridSession", meta: Dict) -> None:
+    for k, v in meta.get("params", {}).items():
+        if hasattr(session, k):
+            setattr(session, k, v)
+
+    session.palette = {int(k): tuple(v) for k, v in meta.get("palette", {}).items()}
+    session.custom_palette = {int(k): tuple(v) for k, v in meta.get("custom_palette", {}).items()}
+
+def _load_legacy(session: "TramaGridSession", s_dir: str) -> Dict:
+    """Carrega o formato antigo (meta.json + PNGs); o próximo snapshot já grava o contêiner"""
+    with open(os.path.join(s_dir, "meta.json"), "r") as f:
+        meta = json.load(f)
+    _apply_header(session, meta)
+
+    # O original fica codificado até ser usado
+    if os.path.exists(os.path.join(s_dir, "original.png")):
+        with open(os.path.join(s_dir, "original.png"), "rb") as f:
+            session._original_blob = f.read()
+
+    if os.path.exists(os.path.join(s_dir, "quantized.png")):
+        session.quantized = Image.open(os.path.join(s_dir, "quantized.png")).convert("P")
+        session.quantized.putpalette(palette_lut(session))
+    return meta
 
 def load_from_disk(session: "TramaGridSession", session_id: str) -> bool:
     """Carrega o estado da sessão do disco"""
     s_dir = os.path.join(DATA_DIR, session_id)
-    meta_path = os.path.join(s_dir, "meta.json")
-    if not os.path.exists(meta_path):
+    container_path = os.path.join(s_dir, CONTAINER_FILE)
+    if not os.path.exists(container_path) and not os.path.exists(os.path.join(s_dir, "meta.json")):
         return False
 
     try:
-        with open(meta_path, "r") as f:
-            meta = json.load(f)
-
-        p = meta.get("params", {})
-        for k, v in p.items():
-            if hasattr(session, k):
-                setattr(session, k, v)
-
-        session.palette = {int(k): tuple(v) for k, v in meta.get("palette", {}).items()}
-        session.custom_palette = {int(k): tuple(v) for k, v in meta.get("custom_palette", {}).items()}
-
-        if os.path.exists(os.path.join(s_dir, "original.png")):
-            from PIL import Image
-            session.original = Image.open(os.path.join(s_dir, "original.png")).convert("RGB")
-
-        if os.path.exists(os.path.join(s_dir, "quantized.png")):
-            from PIL import Image
-            session.quantized = Image.open(os.path.join(s_dir, "quantized.png")).convert("P")
-            flat_palette = [0] * 768
-            for idx, (r, g, b) in session.palette.items():
-                if idx < 256:
-                    flat_palette[idx*3:idx*3+3] = [r, g, b]
-            session.quantized.putpalette(flat_palette)
+        if os.path.exists(container_path):
+            # OTIMIZAÇÃO: Sem decodificar PNG: índices mapeados em memória, original adiado
+            meta, plane, original_blob = read_container(container_path)
+            _apply_header(session, meta)
+            session._original_blob = original_blob
+            session.quantized = plane
+            if plane is not None:
+                plane.putpalette(palette_lut(session))
+        else:
+            meta = _load_legacy(session, s_dir)
+
+        # Reaplica o diário sem renderizar a cada operação; desenha uma vez no final
+        session._render_deferred = True
+        try:
+            replay_journal(session, s_dir, meta.get("journal_gen", 0))
+        finally:
+            session._render_deferred = False
 
         if session.quantized:
             session._draw_grid()
@@ -88,23 +122,31 @@ def load_from_disk(session: "TramaGridSession", session_id: str) -> bool:
         print(f"Erro ao carregar sessão {session_id}: {e}")
         return False
 
-def _save_state(session: "TramaGridSession"):
-    """Salva o estado atual antes de uma modificação com otimização de memória"""
-    if not session.quantized:
-        return
-
-    # OTIMIZAÇÃO DE MEMÓRIA: Armazena apenas dados binários em vez de objetos Image
-    # Isso economiza ~90% de memória RAM por estado salvo
-    state = {
-        'quantized_data': session.quantized.tobytes(),  # Dados binários da imagem
-        'quantized_size': session.quantized.size,       # Dimensões (largura, altura)
-        'quantized_mode': session.quantized.mode,       # Modo da imagem
-        'palette': session.palette.copy(),
-        'custom_palette': session.custom_palette.copy()
-    }
+def convert_legacy_dir(s_dir: str) -> bool:
+    """Converte uma pasta no formato antigo para o contêiner, mantendo o diário válido
 
-    if len(session.history) >= 30:
-        session.history.pop(0)
+    O original.png é copiado como está (sem decodificar); só o quantized.png é lido.
+    """
+    meta_path = os.path.join(s_dir, "meta.json")
+    if not os.path.exists(meta_path) or os.path.exists(os.path.join(s_dir, CONTAINER_FILE)):
+        return False
 
-    session.history.append(state)
-    session.redo_history = []  # Limpa o refazer ao fazer nova ação
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+
+    plane = None
+    q_path = os.path.join(s_dir, "quantized.png")
+    if os.path.exists(q_path):
+        plane = Image.open(q_path).convert("P")
+
+    original_blob = None
+    o_path = os.path.join(s_dir, "original.png")
+    if os.path.exists(o_path):
+        with open(o_path, "rb") as f:
+            original_blob = f.read()
+
+    header = {k: meta[k] for k in ("params", "palette", "custom_palette") if k in meta}
+    header["journal_gen"] = meta.get("journal_gen", 0)
+    write_container(os.path.join(s_dir, CONTAINER_FILE), header, plane, original_blob)
+    _remove_legacy_files(s_dir)
+    return True
@@ -0,0 +1,181 @@
+import io
+import math
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from PIL import Image
+
+from .grid import render_cells
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Tiles quadrados de tamanho fixo, como em mapas
+TILE_SIZE = 256
+
+# Tamanho da célula (px) em cada nível de zoom; potências de 2 mantêm os tiles alinhados às células
+ZOOM_CELL_SIZES = (2, 4, 8, 16, 32)
+
+# Abaixo desse tamanho de célula as linhas de grade viram ruído e não são desenhadas
+MIN_LINE_CELL_SIZE = 8
+
+# Tiles PNG guardados por sessão (LRU)
+MAX_CACHED_TILES = 512
+
+# Retângulos invalidados lembrados para versionar os tiles (mais antigos: versão conservadora)
+TILE_LOG_SIZE = 256
+
+class TileCache:
+    """Cache LRU de tiles PNG de uma sessão, invalidado por retângulo de células editado"""
+
+    def __init__(self, max_tiles: int = MAX_CACHED_TILES):
+        self.max_tiles = max_tiles
+        self._tiles: "OrderedDict[Tuple[int, int, int], bytes]" = OrderedDict()
+        self.nbytes = 0
+        # Versões para a ETag: cada invalidação é uma versão nova com o retângulo afetado;
+        # clear() (grade redesenhada inteira) recomeça de uma base acima de todas
+        self.version = 0
+        self._base = 0
+        # Opções de renderização com que os tiles guardados foram feitos (ver _sync_options)
+        self.options: Optional[Tuple] = None
+        self._log: "deque[Tuple[int, Tuple[int, int, int, int]]]" = deque(maxlen=TILE_LOG_SIZE)
+
+    def get(self, key: Tuple[int, int, int]):
+        data = self._tiles.get(key)
+        if data is not None:
+            self._tiles.move_to_end(key)
+        return data
+
+    def put(self, key: Tuple[int, int, int], data: bytes) -> None:
+        old = self._tiles.pop(key, None)
+        if old is not None:
+            self.nbytes -= len(old)
+        self._tiles[key] = data
+        self.nbytes += len(data)
+        while len(self._tiles) > self.max_tiles:
+            self.nbytes -= len(self._tiles.popitem(last=False)[1])
+
+    def invalidate(self, box: Tuple[int, int, int, int]) -> None:
+        """Descarta os tiles de todos os níveis que cobrem o retângulo de células (x1/y1 exclusivos)"""
+        self.version += 1
+        self._log.append((self.version, box))
+        if not self._tiles:
+            return
+        for key in [k for k in self._tiles if _tile_intersects(k, box)]:
+            self.nbytes -= len(self._tiles.pop(key))
+
+    def clear(self) -> None:
+        self._tiles.clear()
+        self.nbytes = 0
+        self.version += 1
+        self._base = self.version
+        self._log.clear()
+
+    def tile_version(self, key: Tuple[int, int, int]) -> int:
+        """Versão da última mudança que pode ter afetado o tile (vale também para tiles fora do cache)"""
+        for v, box in reversed(self._log):
+            if _tile_intersects(key, box):
+                return v
+        if self._log and self._log[0][0] > self._base + 1:
+            return self._log[0][0] - 1  # Parte das invalidações já saiu do registro
+        return self._base
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+def _cells_per_tile(z: int) -> int:
+    return TILE_SIZE // ZOOM_CELL_SIZES[z]
+
+def _tile_intersects(key: Tuple[int, int, int], box: Tuple[int, int, int, int]) -> bool:
+    z, tx, ty = key
+    n = _cells_per_tile(z)
+    x0, y0, x1, y1 = box
+    return tx * n < x1 and x0 < (tx + 1) * n and ty * n < y1 and y0 < (ty + 1) * n
+
+def tile_ids(box: Tuple[int, int, int, int], wc: int, hc: int) -> Dict[int, list]:
+    """Lista, por nível de zoom, os tiles [tx, ty] que cobrem um retângulo de células"""
+    x0, y0, x1, y1 = box
+    result = {}
+    for z in range(len(ZOOM_CELL_SIZES)):
+        n = _cells_per_tile(z)
+        result[z] = [[tx, ty]
+                     for ty in range(y0 // n, (min(y1, hc) - 1) // n + 1)
+                     for tx in range(x0 // n, (min(x1, wc) - 1) // n + 1)]
+    return result
+
+def get_tile_info(session: "TramaGridSession") -> Dict:
+    """Descreve os níveis de zoom disponíveis para a grade da sessão"""
+    if not session.quantized:
+        return {"tile_size": TILE_SIZE, "width_cells": 0, "height_cells": 0, "levels": []}
+
+    wc, hc = session.quantized.size
+    levels = []
+    for z, cs in enumerate(ZOOM_CELL_SIZES):
+        n = _cells_per_tile(z)
+        levels.append({
+            "z": z,
+            "cell_size": cs,
+            "cols": math.ceil(wc / n),
+            "rows": math.ceil(hc / n)
+        })
+    return {"tile_size": TILE_SIZE, "width_cells": wc, "height_cells": hc, "levels": levels}
+
+def tile_box(session: "TramaGridSession", z: int, tx: int, ty: int) -> Tuple[int, int, int, int]:
+    """Retângulo de células (x1/y1 exclusivos) do tile; levanta ValueError se o tile não existe"""
+    if not session.quantized:
+        raise ValueError("Grade não gerada")
+    if not 0 <= z < len(ZOOM_CELL_SIZES):
+        raise ValueError("Nível de zoom inválido")
+
+    wc, hc = session.quantized.size
+    n = _cells_per_tile(z)
+    box = (tx * n, ty * n, min(wc, (tx + 1) * n), min(hc, (ty + 1) * n))
+    if tx < 0 or ty < 0 or box[0] >= box[2] or box[1] >= box[3]:
+        raise ValueError("Tile fora da grade")
+    return box
+
+def _tile_lines(session: "TramaGridSession", z: int) -> bool:
+    return session.show_grid and ZOOM_CELL_SIZES[z] >= MIN_LINE_CELL_SIZE
+
+def _sync_options(session: "TramaGridSession") -> None:
+    """Descarta os tiles guardados se as opções de renderização mudaram desde que foram feitos"""
+    options = (session.show_grid,)
+    if session.tiles.options != options:
+        session.tiles.clear()
+        session.tiles.options = options
+
+def render_tile(session: "TramaGridSession", z: int, tx: int, ty: int) -> Image.Image:
+    """Renderiza um tile direto de session.quantized + paleta (sem numeração dos eixos)"""
+    box = tile_box(session, z, tx, ty)
+    cells = render_cells(session, box, cell_size=ZOOM_CELL_SIZES[z], lines=_tile_lines(session, z))
+    if cells.size == (TILE_SIZE, TILE_SIZE):
+        return cells
+
+    # Tiles da borda: completa com branco para manter o tamanho fixo
+    tile = Image.new("RGB", (TILE_SIZE, TILE_SIZE), (255, 255, 255))
+    tile.paste(cells, (0, 0))
+    return tile
+
+def tile_etag(session: "TramaGridSession", z: int, tx: int, ty: int) -> str:
+    """ETag forte do tile: instância da sessão, opções de renderização e versão da última
+    mudança que o cobre; levanta ValueError se o tile não existe
+
+    OTIMIZAÇÃO: Editar uma célula só muda a ETag dos tiles que a cobrem; os demais seguem
+    respondendo 304 na revalidação, sem renderizar nem reenviar o PNG.
+    """
+    tile_box(session, z, tx, ty)
+    _sync_options(session)
+    lines = int(_tile_lines(session, z))
+    version = session.tiles.tile_version((z, tx, ty))
+    return f'"{session._render_id}-{version}-{lines}-{session.highlighted_row}"'
+
+def get_tile_png(session: "TramaGridSession", z: int, tx: int, ty: int) -> bytes:
+    """Retorna o tile como PNG, usando o cache da sessão"""
+    _sync_options(session)
+    key = (z, tx, ty)
+    data = session.tiles.get(key)
+    if data is None:
+        buf = io.BytesIO()
+        render_tile(session, z, tx, ty).save(buf, "PNG")
+        data = buf.getvalue()
+        session.tiles.put(key, data)
+    return data
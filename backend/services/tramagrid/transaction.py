@@ -0,0 +1,103 @@
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from .session import TramaGridSession
+
+# Operações aceitas em um lote (nome do método da sessão)
+BATCH_OPS = {
+    "paint_cell", "replace_index_in_region", "remap_region", "flood_fill", "replace_color",
+    "merge_colors", "merge_many_colors", "delete_color", "add_color_to_palette",
+}
+
+# Argumentos de cada operação: quantos são obrigatórios e o tipo de cada posição
+# ("int": coordenada/tamanho, "idx": índice 0..255, "table": {de: para} com índices,
+# "idx_list": lista de índices, "hex": cor em texto, "bool": flag)
+BATCH_ARGS = {
+    "paint_cell": (3, ("int", "int", "idx")),
+    "replace_index_in_region": (6, ("int", "int", "int", "int", "idx", "idx")),
+    "remap_region": (5, ("int", "int", "int", "int", "table", "bool")),
+    "flood_fill": (3, ("int", "int", "idx", "int")),
+    "replace_color": (2, ("idx", "hex")),
+    "merge_colors": (2, ("idx", "idx")),
+    "merge_many_colors": (2, ("idx_list", "idx")),
+    "delete_color": (1, ("idx",)),
+    "add_color_to_palette": (1, ("hex",)),
+}
+
+def _is_int(v) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+def _is_idx(v) -> bool:
+    return _is_int(v) and 0 <= v <= 255
+
+def _is_table_key(k) -> bool:
+    # Chaves de objeto JSON chegam como texto
+    if isinstance(k, str):
+        return k.isdigit() and int(k) <= 255
+    return _is_idx(k)
+
+_ARG_CHECKS = {
+    "int": _is_int,
+    "idx": _is_idx,
+    "table": lambda v: isinstance(v, dict) and all(_is_table_key(k) and _is_idx(t) for k, t in v.items()),
+    "idx_list": lambda v: isinstance(v, list) and all(_is_idx(i) for i in v),
+    "hex": lambda v: isinstance(v, str),
+    "bool": lambda v: isinstance(v, bool),
+}
+
+def _validate(ops: List[Dict]) -> None:
+    """Confere nome, quantidade e tipo dos argumentos de todas as operações antes de aplicar
+    qualquer uma (ValueError com a posição da primeira inválida)"""
+    if not isinstance(ops, list):
+        raise ValueError("Lote inválido")
+    for i, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get("op") not in BATCH_OPS:
+            raise ValueError(f"Operação inválida no lote (posição {i})")
+        args = op.get("args", [])
+        required, kinds = BATCH_ARGS[op["op"]]
+        if not isinstance(args, list) or not required <= len(args) <= len(kinds):
+            raise ValueError(f"Argumentos inválidos no lote (posição {i})")
+        for value, kind in zip(args, kinds):
+            if not _ARG_CHECKS[kind](value):
+                raise ValueError(f"Argumentos inválidos no lote (posição {i})")
+
+def apply_batch(session: "TramaGridSession", ops: List[Dict]) -> List[Any]:
+    """Aplica uma lista de operações como uma transação: tudo ou nada
+
+    OTIMIZAÇÃO: Um único estado salvo no histórico (um desfazer desfaz o lote inteiro) e uma
+    única renderização no final, que repinta só os retângulos sujos quando a paleta não mudou.
+    Se qualquer operação falhar, a grade e a paleta voltam ao estado anterior ao lote.
+    """
+    _validate(ops)
+    if not ops:
+        return []
+
+    backup = (session.quantized.copy() if session.quantized else None, dict(session.palette),
+              dict(session.custom_palette), session.max_colors)
+    redo = session.redo_history
+    session._save_state()
+
+    deferred = session._render_deferred
+    session._in_transaction = True
+    session._render_deferred = True
+    try:
+        results = [getattr(session, op["op"])(*op.get("args", [])) for op in ops]
+    except Exception:
+        _rollback(session, backup, redo)
+        raise
+    finally:
+        session._in_transaction = False
+        session._render_deferred = deferred
+        if not deferred:
+            session._refresh_grid()
+    return results
+
+def _rollback(session: "TramaGridSession", backup, redo: List[Dict]) -> None:
+    """Volta ao estado anterior ao lote, sem deixar rastro no histórico"""
+    session.quantized, session.palette, session.custom_palette, session.max_colors = backup
+    session._pending_state = None
+    if redo and not session.redo_history:
+        session.redo_history = redo
+        session.history_bytes += sum(e['nbytes'] for e in redo)
+    if session.quantized:
+        session._mark_dirty(0, 0, *session.quantized.size)
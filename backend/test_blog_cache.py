@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Testes do cache de leitura do blog (TTLCache): uma busca por chave, falhas não guardadas
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from services.db import TTLCache
+
+def test_loader_error_is_not_cached_and_leaves_no_lock():
+    cache = TTLCache(ttl=60, max_entries=8)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise RuntimeError("Supabase fora do ar")
+
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            cache.get("post:x", failing)
+    assert len(calls) == 3
+    assert cache._loading == {}
+
+    assert cache.get("post:x", lambda: {"slug": "x"}).value == {"slug": "x"}
+    assert cache._loading == {}
+
+def test_not_found_is_cached_for_the_ttl():
+    cache = TTLCache(ttl=60, max_entries=8)
+    calls = []
+
+    def missing():
+        calls.append(1)
+        return None
+
+    assert cache.get("post:nope", missing).value is None
+    assert cache.get("post:nope", missing).value is None
+    assert len(calls) == 1
+
+def test_invalidate_forces_a_new_load():
+    cache = TTLCache(ttl=60, max_entries=8)
+    first = cache.get("posts", lambda: [1])
+    cache.invalidate()
+    second = cache.get("posts", lambda: [1, 2])
+    assert second.value == [1, 2] and second.etag != first.etag
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Testes da fila de exportação: cache por hash do conteúdo e renderização fora do lock da fila
+"""
+
+import io
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from PIL import Image
+
+from services.tramagrid import export_jobs
+from services.tramagrid.export_jobs import ExportQueue
+from services.tramagrid.offload import heavy_pool
+from services.tramagrid.session import TramaGridSession
+
+@pytest.fixture(autouse=True)
+def inline_pool(tmp_path, monkeypatch):
+    # EXPORT_CACHE_DIR é relativo; HEAVY_WORKERS=0 renderiza na própria thread
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(heavy_pool, "workers", 0)
+
+def _new_session() -> TramaGridSession:
+    img = Image.effect_mandelbrot((160, 120), (-2, -1, 1, 1), 60).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    session = TramaGridSession()
+    session.load_image(buf.getvalue())
+    session.grid_width_cells = 40
+    session.max_colors = 8
+    session.generate_grid()
+    return session
+
+def test_status_is_not_blocked_by_an_inline_render(monkeypatch):
+    queue = ExportQueue()
+    started, release = threading.Event(), threading.Event()
+    render = export_jobs._render_export
+
+    def slow_render(kind, state, path):
+        started.set()
+        assert release.wait(5)
+        render(kind, state, path)
+
+    monkeypatch.setattr(export_jobs, "_render_export", slow_render)
+    session = _new_session()
+    result, duplicate = {}, {}
+    worker = threading.Thread(target=lambda: result.update(queue.submit(session, "png")))
+    worker.start()
+    assert started.wait(5)
+
+    # Com a renderização em andamento, a fila continua respondendo: o mesmo pedido devolve o job
+    # que já está rodando em vez de esperar pelo lock
+    other = threading.Thread(target=lambda: duplicate.update(queue.submit(session, "png")), daemon=True)
+    other.start()
+    other.join(2)
+    release.set()
+    assert duplicate.get("status") == "running"
+    job_id = duplicate["job_id"]
+    worker.join(5)
+    assert result["status"] == "done"
+    assert queue.result(job_id) is not None
+
+def test_display_only_params_reuse_the_cached_export():
+    queue = ExportQueue()
+    session = _new_session()
+    first = queue.submit(session, "png")
+    session.highlighted_row = 3
+    again = queue.submit(session, "png")
+    assert first["status"] == again["status"] == "done"
+    assert queue._jobs[first["job_id"]]["hash"] == queue._jobs[again["job_id"]]["hash"]
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Testes de persistência: snapshot (session.bin) + diário de operações devem recarregar
+exatamente o estado que estava em memória
+"""
+
+import io
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from PIL import Image
+
+from services.tramagrid.session import TramaGridSession
+
+def _image_bytes() -> bytes:
+    img = Image.effect_mandelbrot((160, 120), (-2, -1, 1, 1), 60).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+def _new_session() -> TramaGridSession:
+    session = TramaGridSession()
+    session.load_image(_image_bytes())
+    session.grid_width_cells = 40
+    session.max_colors = 8
+    session.generate_grid()
+    return session
+
+def _reload(sid: str) -> TramaGridSession:
+    session = TramaGridSession()
+    assert session.load_from_disk(sid)
+    return session
+
+def _assert_same(a: TramaGridSession, b: TramaGridSession) -> None:
+    assert a.quantized.size == b.quantized.size
+    assert a.quantized.tobytes() == b.quantized.tobytes()
+    assert a.palette == b.palette
+    assert a.max_colors == b.max_colors
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    # DATA_DIR é relativo: cada teste grava em uma pasta própria
+    monkeypatch.chdir(tmp_path)
+
+def test_reload_after_lite_saves():
+    s = _new_session()
+    s.save_to_disk("t")
+    s.paint_cell(1, 1, 3)
+    s.flood_fill(10, 10, 2)
+    s.remap_region(0, 0, 20, 20, {1: 4, 2: 5})
+    s.replace_color(3, "#123456")
+    s.save_to_disk("t", lite=True)
+    _assert_same(s, _reload("t"))
+
+def test_undo_of_regenerated_grid():
+    s = _new_session()
+    s.paint_cell(2, 2, 1)
+    s.save_to_disk("t", lite=True)
+    s.max_colors = 12
+    s.generate_grid()
+    s.save_to_disk("t", lite=True)  # Grade regerada: snapshot novo
+    s.undo()  # Volta para a grade de 8 cores, que não está no snapshot
+    s.save_to_disk("t", lite=True)
+    _assert_same(s, _reload("t"))
+
+def test_reload_replays_undo_and_redo():
+    s = _new_session()
+    s.save_to_disk("t")
+    s.paint_cell(2, 2, 1)
+    s.paint_cell(3, 3, 5)
+    s.paint_cell(4, 4, 6)
+    s.undo()
+    s.save_to_disk("t", lite=True)
+    _assert_same(s, _reload("t"))
+
+    s.undo()
+    s.redo()
+    s.save_to_disk("t", lite=True)
+    reloaded = _reload("t")
+    _assert_same(s, reloaded)
+
+    # O histórico reconstruído no replay continua desfazendo a mesma coisa
+    s.undo()
+    reloaded.undo()
+    _assert_same(s, reloaded)
+
+def test_undo_of_edit_before_snapshot():
+    s = _new_session()
+    s.paint_cell(5, 5, 1)
+    s.save_to_disk("t")  # O desfazer desta pintura só existe em memória
+    s.undo()
+    s.save_to_disk("t", lite=True)
+    _assert_same(s, _reload("t"))
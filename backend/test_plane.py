@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Testes do plano de índices em binário (TGPL): ida e volta, ETag/304 e respostas incrementais
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+import zlib
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import app
+from services.tramagrid.manager import session_manager
+from services.tramagrid.plane import PLANE_MAGIC, encode_plane, note_change, plane_token
+
+@pytest.fixture
+def sid(tmp_path, monkeypatch):
+    # DATA_DIR é relativo: cada teste grava em uma pasta própria
+    monkeypatch.chdir(tmp_path)
+    img = Image.effect_mandelbrot((160, 120), (-2, -1, 1, 1), 60).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    sid, _ = session_manager.create()
+    with session_manager.use(sid) as s:
+        s.load_image(buf.getvalue())
+        s.grid_width_cells = 40
+        s.max_colors = 8
+        s.generate_grid()
+        s.save_to_disk(sid)
+    return sid
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+def _unpack(body: bytes):
+    magic, size = struct.unpack_from("<4sI", body)
+    assert magic == PLANE_MAGIC
+    header = json.loads(body[8:8 + size])
+    return header, body[8 + size:]
+
+def _decode(header, data) -> bytes:
+    if header["encoding"] == "zlib":
+        return zlib.decompress(data)
+    if header["encoding"] == "rle":
+        runs = np.frombuffer(data, dtype=[("idx", "u1"), ("count", "<u2")])
+        return np.repeat(runs["idx"], runs["count"]).tobytes()
+    return data
+
+def _plane_bytes(sid) -> bytes:
+    with session_manager.use(sid) as s:
+        return s.quantized.tobytes()
+
+@pytest.mark.parametrize("encoding", ["zlib", "rle", "raw"])
+def test_full_plane_round_trip(client, sid, encoding):
+    r = client.get(f"/api/plane/{sid}", params={"encoding": encoding})
+    assert r.status_code == 200
+    header, data = _unpack(r.content)
+    assert header["full"] and header["box"] == [0, 0, header["width"], header["height"]]
+    assert _decode(header, data) == _plane_bytes(sid)
+    assert r.headers["x-plane-version"] == header["version"]
+
+def test_unchanged_plane_revalidates_with_304(client, sid):
+    r = client.get(f"/api/plane/{sid}")
+    etag = r.headers["etag"]
+    again = client.get(f"/api/plane/{sid}", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag
+
+    # Cor trocada: o plano não muda, mas a paleta faz parte da ETag
+    with session_manager.use(sid) as s:
+        s.replace_color(next(iter(s.palette)), "#123456")
+    assert client.get(f"/api/plane/{sid}", headers={"If-None-Match": etag}).status_code == 200
+
+def test_incremental_response_covers_the_edit(client, sid):
+    header, _ = _unpack(client.get(f"/api/plane/{sid}").content)
+    with session_manager.use(sid) as s:
+        idx = next(k for k in s.palette if k != s.quantized.getpixel((5, 7)))
+    client.post(f"/api/batch/{sid}", json={"ops": [{"op": "paint_cell", "args": [5, 7, idx]}]})
+
+    r = client.get(f"/api/plane/{sid}", params={"since": header["version"], "encoding": "raw"})
+    inc, data = _unpack(r.content)
+    assert not inc["full"] and inc["box"] == [5, 7, 6, 8]
+    assert data == bytes([idx])
+    assert "etag" not in r.headers
+
+    # Já em dia: nenhuma caixa, só a paleta
+    latest, _ = _unpack(client.get(f"/api/plane/{sid}", params={"since": inc["version"]}).content)
+    assert latest["box"] is None
+
+def test_note_change_and_plane_swap():
+    from services.tramagrid.session import TramaGridSession
+    s = TramaGridSession()
+    s.quantized = Image.new("P", (10, 10))
+    s.palette = {0: (0, 0, 0)}
+    since = plane_token(s)
+
+    note_change(s, (1, 1, 3, 2))
+    note_change(s, (4, 0, 5, 5))
+    header, _ = encode_plane(s, "raw", since)
+    assert header["box"] == [1, 0, 5, 5]
+
+    # Trocar o objeto do plano zera o registro: a próxima resposta é o plano inteiro
+    s.quantized = s.quantized.copy()
+    header, data = encode_plane(s, "raw", since)
+    assert header["full"] and len(data) == 100
+
+    # Versão de outra instância da sessão também não serve
+    header, _ = encode_plane(s, "raw", "outra-1")
+    assert header["full"]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Testes dos tiles: ETag por tile, 304 na revalidação e 404 para tiles que não existem
+"""
+
+import io
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app import app
+from services.tramagrid.manager import session_manager
+
+@pytest.fixture
+def sid(tmp_path, monkeypatch):
+    # DATA_DIR é relativo: cada teste grava em uma pasta própria
+    monkeypatch.chdir(tmp_path)
+    img = Image.effect_mandelbrot((400, 300), (-2, -1, 1, 1), 60).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    sid, _ = session_manager.create()
+    with session_manager.use(sid) as s:
+        s.load_image(buf.getvalue())
+        s.grid_width_cells = 200
+        s.max_colors = 8
+        s.generate_grid()
+        s.save_to_disk(sid)
+    return sid
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+def _paint(client, sid, x, y):
+    with session_manager.use(sid) as s:
+        current = s.quantized.getpixel((x, y))
+        idx = next(k for k in s.palette if k != current)
+    r = client.post(f"/api/batch/{sid}", json={"ops": [{"op": "paint_cell", "args": [x, y, idx]}]})
+    assert r.status_code == 200
+
+def test_revalidation_gives_304_until_the_tile_changes(client, sid):
+    # z=3: células de 16 px, 16 células por tile
+    r = client.get(f"/api/tiles/{sid}/3/2/0.png")
+    assert r.status_code == 200 and r.headers["content-type"] == "image/png"
+    etag = r.headers["etag"]
+    other = client.get(f"/api/tiles/{sid}/3/0/0.png").headers["etag"]
+
+    assert client.get(f"/api/tiles/{sid}/3/2/0.png", headers={"If-None-Match": etag}).status_code == 304
+
+    _paint(client, sid, 40, 1)  # Dentro do tile (2, 0)
+    assert client.get(f"/api/tiles/{sid}/3/2/0.png", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get(f"/api/tiles/{sid}/3/0/0.png", headers={"If-None-Match": other}).status_code == 304
+
+def test_show_grid_changes_the_etag(client, sid):
+    etag = client.get(f"/api/tiles/{sid}/3/0/0.png").headers["etag"]
+    with session_manager.use(sid) as s:
+        s.show_grid = not s.show_grid
+    r = client.get(f"/api/tiles/{sid}/3/0/0.png", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+
+@pytest.mark.parametrize("path", ["9/0/0", "-1/0/0", "3/99/0", "3/0/99", "3/-1/0"])
+def test_missing_tile_is_404(client, sid, path):
+    _paint(client, sid, 1, 1)  # Com invalidações no registro, o cálculo da ETag percorre os retângulos
+    r = client.get(f"/api/tiles/{sid}/{path}.png", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Testes de lote de edições: validação antes de aplicar e rollback completo quando algo falha
+"""
+
+import io
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from PIL import Image
+
+from services.tramagrid.session import TramaGridSession
+
+def _new_session() -> TramaGridSession:
+    img = Image.effect_mandelbrot((160, 120), (-2, -1, 1, 1), 60).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    session = TramaGridSession()
+    session.load_image(buf.getvalue())
+    session.grid_width_cells = 40
+    session.max_colors = 8
+    session.generate_grid()
+    return session
+
+def _state(session: TramaGridSession):
+    return (session.quantized.tobytes(), dict(session.palette), dict(session.custom_palette),
+            len(session.history), len(session.redo_history))
+
+@pytest.mark.parametrize("ops", [
+    [{"op": "remap_region", "args": [0, 0, 5, 5, [1, 2]]}],
+    [{"op": "remap_region", "args": [0, 0, 5, 5, {"999": 1}]}],
+    [{"op": "remap_region", "args": [0, 0, 5, 5, {"1": 300}]}],
+    [{"op": "paint_cell", "args": [1, 1]}],
+    [{"op": "paint_cell", "args": [1, 1, 2, 3]}],
+    [{"op": "paint_cell", "args": ["1", 1, 2]}],
+    [{"op": "merge_many_colors", "args": [[1, -1], 0]}],
+    [{"op": "replace_color", "args": [1, 255]}],
+    [{"op": "paint_cell", "args": [1, 1, 2]}, {"op": "_save_state", "args": []}],
+])
+def test_invalid_batch_is_rejected_before_applying(ops):
+    s = _new_session()
+    before = _state(s)
+    with pytest.raises(ValueError):
+        s.apply_batch(ops)
+    assert _state(s) == before
+
+def test_batch_rolls_back_when_an_op_fails():
+    s = _new_session()
+    s.paint_cell(0, 0, 1)
+    s.undo()  # Deixa algo no refazer, que o lote com falha não pode apagar
+    before = _state(s)
+    missing = next(i for i in range(256) if i not in s.palette)
+    with pytest.raises(ValueError):
+        s.apply_batch([
+            {"op": "paint_cell", "args": [2, 2, 3]},
+            {"op": "replace_color", "args": [1, "#102030"]},
+            {"op": "remap_region", "args": [0, 0, 10, 10, {"1": missing}]},  # Passa na validação, falha ao aplicar
+        ])
+    assert _state(s) == before
+
+def test_valid_batch_is_one_undo_step():
+    s = _new_session()
+    original = s.quantized.tobytes()
+    s.apply_batch([
+        {"op": "paint_cell", "args": [2, 2, 3]},
+        {"op": "remap_region", "args": [0, 0, 10, 10, {"1": 2}]},
+    ])
+    assert s.quantized.tobytes() != original
+    s.undo()
+    assert s.quantized.tobytes() == original
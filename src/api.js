@@ -151,19 +151,19 @@ export async function getPalette() {
   return await res.json()
 }
 
+// URL de objeto da última grade baixada (liberada quando chega a próxima)
+let gridObjectUrl = ""
+
 export async function getGridImage() {
   if (!sessionId.value) return ""
-  // CORREÇÃO DE CACHE: Adicionado ?t=... para o Desfazer funcionar
-  const res = await fetch(`${API_BASE}/api/grid/${sessionId.value}?t=${Date.now()}`)
-  const data = await res.json()
-  if (!data) return ""
-  if (typeof data === "string") return data
-  if (data.image_base64) {
-    return data.image_base64.startsWith("data:") 
-      ? data.image_base64 
-      : `data:image/png;base64,${data.image_base64}`
-  }
-  return ""
+  // A grade vem em bytes crus com ETag: 'no-cache' revalida no servidor, que responde 304
+  // sem corpo quando nada mudou, e o navegador reaproveita a imagem que já tem
+  const res = await fetch(`${API_BASE}/api/grid/${sessionId.value}`, { cache: 'no-cache' })
+  if (!res.ok) return ""
+  const blob = await res.blob()
+  if (gridObjectUrl) URL.revokeObjectURL(gridObjectUrl)
+  gridObjectUrl = URL.createObjectURL(blob)
+  return gridObjectUrl
 }
 
 export async function updateParams(params) {